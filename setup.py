@@ -50,4 +50,5 @@ setup(
 
     # This is true, but doesn't work realiably
     #install_requires=['gi', 'gi-cairo'],
+    extras_require=dict(numpy=['numpy']),
 )
@@ -23,7 +23,14 @@ assert sys.version_info.major >= 3
 __all__ = ['dot', 'ui']
 
 from . import dot
-from . import ui
-from .ui import DotWidget, DotWindow
+
+
+def __getattr__(name):
+    # The user interface needs Gtk, which exporting and benchmarking do
+    # not, so it is only imported once used.
+    if name in ('ui', 'DotWidget', 'DotWindow'):
+        from . import ui
+        return ui if name == 'ui' else getattr(ui, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 __author__ = "Jose Fonseca et al"
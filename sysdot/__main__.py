@@ -19,15 +19,22 @@
 import argparse
 import sys
 
-from .ui.window import DotWindow, Gtk
-
 
 def main():
 
+    if sys.argv[1:2] == ['export']:
+        from . import export
+        sys.exit(export.main(sys.argv[2:]))
+
+    # only the viewer needs Gtk
+    from .ui.window import DotWindow, Gtk
+
     parser = argparse.ArgumentParser(
         description="sysdot.py is an interactive viewer for graphs written in Graphviz's dot language.",
         formatter_class=argparse.RawDescriptionHelpFormatter,
         epilog='''
+Use "%(prog)s export --help" for rendering graphs to files without a window.
+
 Shortcuts:
   Up, Down, Left, Right     scroll
   PageUp, +, =              zoom in
@@ -36,6 +43,7 @@ Shortcuts:
   F                         find
   Q                         quit
   P                         print
+  I                         toggle frame statistics
   Escape                    halt animation
   Ctrl-drag                 zoom in/out
   Shift-drag                zooms an area
@@ -59,6 +67,18 @@ Shortcuts:
         '-g', '--geometry',
         action='store', dest='geometry',
         help='default window size in form WxH')
+    parser.add_argument(
+        '--batch-pens',
+        action='store_true', dest='batch_pens',
+        help='draw shapes sharing a pen with a single cairo call')
+    parser.add_argument(
+        '--stats', metavar='FILE', nargs='?', const='',
+        dest='stats',
+        help='record frame statistics, and write them to FILE (CSV, or JSON if it ends in .json) on exit')
+    parser.add_argument(
+        '--threaded',
+        action='store_true', dest='threaded',
+        help='render the graph on a background thread')
 
     options = parser.parse_args()
     inputfile = options.inputfile
@@ -73,6 +93,12 @@ Shortcuts:
     win = DotWindow(width=width, height=height)
     win.connect('delete-event', Gtk.main_quit)
     win.set_filter(options.filter)
+    if options.batch_pens:
+        win.dotwidget.set_batch_pens(True)
+    if options.threaded:
+        win.dotwidget.set_threaded_rendering(True)
+    if options.stats is not None:
+        win.dotwidget.set_instrumentation(True)
     if inputfile and len(inputfile) >= 1:
         if inputfile == '-':
             win.set_dotcode(sys.stdin.buffer.read())
@@ -90,5 +116,8 @@ Shortcuts:
 
     Gtk.main()
 
+    if options.stats and win.dotwidget.stats is not None:
+        win.dotwidget.stats.dump(options.stats)
+
 if __name__ == '__main__':
     main()
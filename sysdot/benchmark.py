@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+'''
+Headless rendering benchmark for sysdot.ui.elements.Graph.
+
+Renders graphs with Graph.draw into cairo image surfaces, for every
+combination of the given zoom ratios and viewport sizes, and prints one
+record per combination. No display is needed.
+
+    python3 -m sysdot.benchmark --generate 10000
+    python3 -m sysdot.benchmark -z 0.05,0.25,1 -v 800x600,1920x1080 graph.dot
+    python3 -m sysdot.benchmark -n -f csv -o results.csv graph.xdot
+    python3 -m sysdot.benchmark --memory --generate 100000
+'''
+
+import argparse
+import csv
+import json
+import math
+import resource
+import sys
+import time
+import tracemalloc
+
+import cairo
+
+from .dot.filter import run_filter
+from .dot.parser import XDotParser
+from .ui.elements import Node, set_frame_stats
+from .ui.layouts import get_layout_cache
+from .ui.renderer import Viewport
+from .ui.stats import FrameStats
+
+
+FIELDS = ('graph', 'nodes', 'edges', 'zoom_ratio', 'width', 'height', 'batch_pens',
+          'frames', 'first_frame_time', 'frame_time_mean', 'frame_time_min', 'frame_time_max',
+          'nodes_drawn', 'nodes_culled', 'edges_drawn', 'edges_culled', 'layouts_created',
+          'parse_time', 'graph_bytes', 'frame_peak_bytes', 'max_rss_kb')
+MEMORY_FIELDS = ('graph', 'nodes', 'edges', 'parse_time', 'graph_bytes',
+                 'bytes_per_node', 'bytes_per_edge')
+
+
+def generate_xdot(count: int) -> bytes:
+    """
+    Generates the xdot code of a grid of count record-like nodes, each
+    connected to its right and bottom neighbours.
+    """
+    cols = max(int(math.ceil(math.sqrt(count))), 1)
+    rows = int(math.ceil(count / cols))
+    dx, dy = 160, 120  # grid spacing
+    w, h = 96, 36  # node size
+    width, height = cols * dx, rows * dy
+
+    def text(x, y, s):
+        return 'T %g %g 0 %g %d -%s ' % (x, y, 7 * len(s), len(s.encode('utf-8')), s)
+
+    def center(i):
+        return dx / 2 + (i % cols) * dx, height - dy / 2 - (i // cols) * dy
+
+    def edge(i, j, x0, y0, x3, y3):
+        # straight bezier, ending where the arrow head starts
+        ux, uy = (x3 - x0) / math.hypot(x3 - x0, y3 - y0), (y3 - y0) / math.hypot(x3 - x0, y3 - y0)
+        x2, y2 = x3 - 10 * ux, y3 - 10 * uy
+        points = [(x0, y0), (x0 + 8*ux, y0 + 8*uy), (x2 - 8*ux, y2 - 8*uy), (x2, y2)]
+        pos = ' '.join('%g,%g' % p for p in points)
+        draw = 'c 7 -#000000 B 4 ' + ' '.join('%g %g' % p for p in points)
+        head = 'S 5 -solid c 7 -#000000 C 7 -#000000 P 3 %g %g %g %g %g %g' % (
+            x2 - 4*uy, y2 + 4*ux, x3, y3, x2 + 4*uy, y2 - 4*ux)
+        return '%d -> %d [pos="%s", _draw_="%s ", _hdraw_="%s "];\n' % (i, j, pos, draw, head)
+
+    lines = ['digraph G {\n',
+             'graph [bb="0,0,%d,%d", _draw_="c 9 -#fffffe00 C 7 -#ffffff P 4 0 0 0 %d %d %d %d 0 "];\n'
+             % (width, height, height, width, height, width)]
+    for i in range(count):
+        x, y = center(i)
+        x0, y0, x1, y1 = x - w/2, y - h/2, x + w/2, y + h/2
+        draw = 'c 7 -#000000 p 4 %g %g %g %g %g %g %g %g ' % (x0, y0, x1, y0, x1, y1, x0, y1)
+        ldraw = 'F 14 11 -Times-Roman c 7 -#000000 ' + text(x, y + 2, 'node %d' % i) + \
+                text(x, y - 12, 'x = y + %d;' % i)
+        lines.append('%d [pos="%g,%g", width=%g, height=%g, _draw_="%s", _ldraw_="%s"];\n'
+                     % (i, x, y, w / 72., h / 72., draw, ldraw))
+    for i in range(count):
+        x, y = center(i)
+        if (i + 1) % cols and i + 1 < count:
+            lines.append(edge(i, i + 1, x + w/2, y, x + dx - w/2, y))
+        if i + cols < count:
+            lines.append(edge(i, i + cols, x, y - h/2, x, y - dy + h/2))
+    lines.append('}\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def parse(xdotcode: bytes):
+    """Parses xdotcode, returning the graph, the time taken and the bytes allocated."""
+    start = time.perf_counter()
+    graph = XDotParser(xdotcode).parse()
+    parse_time = time.perf_counter() - start
+
+    # tracing slows allocations down, so memory is measured on a parse of
+    # its own
+    tracemalloc.start()
+    traced = XDotParser(xdotcode).parse()
+    graph_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del traced
+    return graph, parse_time, graph_bytes
+
+
+def deep_size(obj, seen, skip=()) -> int:
+    """
+    Returns the size of obj and of everything it references, leaving out the
+    objects in seen, which is updated, and the instances of skip. Sharing a
+    single seen set accounts for the objects shared by several elements once.
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, type):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        children = []
+        if isinstance(obj, dict):
+            children.extend(obj.keys())
+            children.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            children.extend(obj)
+        if hasattr(obj, '__dict__'):
+            children.append(obj.__dict__)
+        for cls in type(obj).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if name not in ('__dict__', '__weakref__') and hasattr(obj, name):
+                    children.append(getattr(obj, name))
+        stack.extend(child for child in children if not isinstance(child, skip))
+    return size
+
+
+def measure_memory(name, graph, parse_time, graph_bytes):
+    """Returns a record of the memory used by the nodes and edges of graph."""
+    seen = set()
+    node_bytes = sum(deep_size(node, seen) for node in graph.nodes)
+    # the nodes an edge connects are accounted for with the nodes
+    edge_bytes = sum(deep_size(edge, seen, skip=Node) for edge in graph.edges)
+    return {
+        'graph': name,
+        'nodes': len(graph.nodes),
+        'edges': len(graph.edges),
+        'parse_time': parse_time,
+        'graph_bytes': graph_bytes,
+        'bytes_per_node': node_bytes / len(graph.nodes) if graph.nodes else None,
+        'bytes_per_edge': edge_bytes / len(graph.edges) if graph.edges else None,
+    }
+
+
+def render(graph, surface, viewport):
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(1.0, 1.0, 1.0)
+    cr.paint()
+    viewport.apply(cr)
+    graph.draw(cr, bounding=viewport.get_bounding())
+    surface.flush()
+
+
+def benchmark(name, graph, zoom_ratio, width, height, frames):
+    """Renders frames frames of graph, and returns a record of how it went."""
+    viewport = Viewport(graph.width / 2, graph.height / 2, zoom_ratio, width, height)
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    layouts = get_layout_cache()
+    layouts.clear()
+
+    # counts, from a first (cold) frame
+    stats = FrameStats()
+    set_frame_stats(stats)
+    stats.begin_frame()
+    layout_misses = layouts.layouts.misses
+    start = time.perf_counter()
+    render(graph, surface, viewport)
+    first_frame_time = time.perf_counter() - start
+    stats.add('layouts_created', layouts.layouts.misses - layout_misses)
+    stats.end_frame()
+    set_frame_stats(None)
+    counts = stats.frames[-1]
+
+    times = []
+    for i in range(frames):
+        start = time.perf_counter()
+        render(graph, surface, viewport)
+        times.append(time.perf_counter() - start)
+
+    # memory, from a last frame, as tracing slows everything down
+    tracemalloc.start()
+    render(graph, surface, viewport)
+    frame_peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'graph': name,
+        'nodes': len(graph.nodes),
+        'edges': len(graph.edges),
+        'zoom_ratio': zoom_ratio,
+        'width': width,
+        'height': height,
+        'batch_pens': graph.batch_pens,
+        'frames': frames,
+        'first_frame_time': first_frame_time,
+        'frame_time_mean': sum(times) / len(times) if times else None,
+        'frame_time_min': min(times, default=None),
+        'frame_time_max': max(times, default=None),
+        'nodes_drawn': counts['nodes_drawn'],
+        'nodes_culled': counts['nodes_culled'],
+        'edges_drawn': counts['edges_drawn'],
+        'edges_culled': counts['edges_culled'],
+        'layouts_created': counts['layouts_created'],
+        'frame_peak_bytes': frame_peak_bytes + surface.get_stride() * height,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the rendering of graphs without a display.')
+    parser.add_argument(
+        'inputfiles', metavar='file', nargs='*',
+        help='graphs to render')
+    parser.add_argument(
+        '-g', '--generate', metavar='NODES', type=int, action='append', default=[],
+        help='also render a generated grid graph with this many nodes (may be repeated)')
+    parser.add_argument(
+        '-z', '--zoom', default='0.01,0.1,0.5,1,2',
+        help='comma separated zoom ratios [default: %(default)s]')
+    parser.add_argument(
+        '-v', '--viewport', default='800x600,1920x1080',
+        help='comma separated viewport sizes in form WxH [default: %(default)s]')
+    parser.add_argument(
+        '--frames', type=int, default=10,
+        help='frames rendered per combination, after a first cold one [default: %(default)s]')
+    parser.add_argument(
+        '--filter', choices=['dot', 'neato', 'twopi', 'circo', 'fdp'],
+        dest='filter', default='dot',
+        help='graphviz filter for the input files [default: %(default)s]')
+    parser.add_argument(
+        '-n', '--no-filter',
+        action='store_const', const=None, dest='filter',
+        help='assume input is already filtered into xdot format (use e.g. dot -Txdot)')
+    parser.add_argument(
+        '--batch-pens', action='store_true',
+        help='draw shapes sharing a pen with a single cairo call')
+    parser.add_argument(
+        '-f', '--format', choices=['json', 'csv'], default='json',
+        help='output format, JSON is one record per line [default: %(default)s]')
+    parser.add_argument(
+        '-o', '--output', metavar='FILE',
+        help='write the records to FILE instead of the standard output')
+    parser.add_argument(
+        '--memory', action='store_true',
+        help='only measure the memory used by the parsed graphs, per node and edge')
+    options = parser.parse_args()
+
+    try:
+        zooms = [float(z) for z in options.zoom.split(',')]
+        viewports = [tuple(int(i) for i in v.split('x')) for v in options.viewport.split(',')]
+    except ValueError:
+        parser.error('invalid zoom ratio or viewport size')
+    if not options.inputfiles and not options.generate:
+        parser.error('no graph to render')
+
+    inputs = []
+    for fileName in options.inputfiles:
+        with open(fileName, 'rb') as f:
+            code = f.read()
+        inputs.append((fileName, lambda code=code: code, False))
+    for count in options.generate:
+        # generated graphs are already laid out
+        inputs.append(('generated-%d' % count, lambda count=count: generate_xdot(count), True))
+
+    out = open(options.output, 'w', newline='') if options.output else sys.stdout
+    writer = None
+    if options.format == 'csv':
+        writer = csv.DictWriter(out, fieldnames=MEMORY_FIELDS if options.memory else FIELDS)
+        writer.writeheader()
+
+    for name, read, generated in inputs:
+        code = read()
+        if options.filter and not generated:
+            code, error = run_filter(options.filter, code)
+            if code is None:
+                sys.stderr.write('%s: %s\n' % (name, error))
+                continue
+        graph, parse_time, graph_bytes = parse(code)
+        graph.batch_pens = options.batch_pens
+        if options.memory:
+            records = [measure_memory(name, graph, parse_time, graph_bytes)]
+        else:
+            records = (benchmark(name, graph, zoom_ratio, width, height, options.frames)
+                       for zoom_ratio in zooms for width, height in viewports)
+        for record in records:
+            record['parse_time'] = parse_time
+            record['graph_bytes'] = graph_bytes
+            if writer is None:
+                out.write(json.dumps(record) + '\n')
+            else:
+                writer.writerow(record)
+            out.flush()
+
+    if out is not sys.stdout:
+        out.close()
+
+
+if __name__ == '__main__':
+    main()
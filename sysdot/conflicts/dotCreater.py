@@ -37,7 +37,8 @@ def bfs(graph):
         while q.empty() is False:
             node = q.get()
             exploredNodes.add(node)
-            edges = [edge for edge in graph.edges if edge.src.id is node]
+            edges = [edge for edge in graph.incident_edges.get(graph.node_by_id.get(node), ())
+                     if edge.src.id == node]
             for edge in edges:
                 dest = edge.dst.id
                 if dest not in exploredNodes:
@@ -1,75 +1,231 @@
-from bs4 import BeautifulSoup as bs
-from typing import List, Set, Dict, Tuple, Optional
-
-def generateMap(fileName: str) -> Dict[int, List[int]]:
-    """
-    returns a dictionary of nodeId to list of nodeId which the key node is in conflict in
-    """
-    import re    
-    def getTags(taggedString: str) -> (int, int):
-        p = re.compile(r"\((\d*),\d\)")
-        m = p.findall(taggedString)
-        return int(m[0]), int(m[1])
-
-    with open(fileName, 'r') as f:
-        soup = bs(f, 'html.parser')
-        tds = soup.findAll('td')
-        result = {}
-        for td in tds:
-            if td.has_attr('title') and td.has_attr('class') and td.get('class') == ["tg-red2"]:
-                key, value = getTags(td.get('title'))
-                if key == value:
-                    continue
-
-                if key in result:
-                    x = result[key]
-                    if value not in x:
-                        x.append(value)
-                else:
-                    result[key] = [value]
-        return result
-
-def generateFullMap(fileName: str) -> Dict[int, List[int]]:
-    import re    
-    def getTags(taggedString: str) -> (int, int):
-        p = re.compile(r"\((\d*),\d\)")
-        m = p.findall(taggedString)
-        return int(m[0]), int(m[1])
-
-    def getStatements(td):
-        return list(map(lambda i: i.contents[0], td.findAll('pre')))
-
-    with open(fileName, 'r') as f:
-        soup = bs(f, 'html.parser')
-        tds = soup.findAll('td')
-        result = {}
-        for td in tds:
-            if td.has_attr('title') and td.has_attr('class') and td.get('class') == ["tg-red2"]:
-                key, value = getTags(td.get('title'))
-                statements = getStatements(td)
-                if key == value:
-                    continue
-                
-                c = ConflictNode(value, statements)
-                if key in result:
-                    x = result[key]
-                    x.add(c)
-                else:
-                    result[key] = {c}
-        return result
-
-
-class ConflictNode:
-    def __init__(self, nodeId, statements):
-        self.nodeId = nodeId
-        self.statements = statements
-
-    def __eq__(self, other):
-        if isinstance(other, ConflictNode):
-            return other.nodeId == self.nodeId
-        return False
- 
-    def __hash__(self):
-        return hash(self.nodeId)
-
- 
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from html.parser import HTMLParser
+import re
+from typing import List, Set, Dict, Tuple, Optional
+
+# node ids in the title of a conflict cell, e.g. "(12,0) (34,1)"
+TAGS_PATTERN = re.compile(r"\((\d*),\d\)")
+CHUNK_SIZE = 1 << 20  # characters read at a time
+
+
+def getTags(taggedString: str) -> (int, int):
+    m = TAGS_PATTERN.findall(taggedString)
+    return int(m[0]), int(m[1])
+
+
+class ConflictCellParser(HTMLParser):
+    """
+    Collects the conflict cells of a conflict table, the td elements of
+    class tg-red2 with a title, as it is fed. Each cell is a tuple of its
+    title and the text of its pre elements, if statements is true.
+    """
+
+    def __init__(self, statements=False):
+        HTMLParser.__init__(self)
+        self.statements = statements
+        self.cells = []
+        # title and statements of the cell being parsed, if any
+        self.cell = None
+        # text at the start of the current pre element, which may come in
+        # several pieces, or None
+        self.pre = None
+
+    def handle_starttag(self, tag, attrs):
+        self.endPre()
+        if tag == 'td':
+            self.endCell()
+            attrs = dict(attrs)
+            title = attrs.get('title')
+            if title is not None and (attrs.get('class') or '').split() == ['tg-red2']:
+                self.cell = (title, [])
+        elif tag == 'pre' and self.cell is not None and self.statements:
+            self.pre = []
+
+    def handle_endtag(self, tag):
+        self.endPre()
+        if tag in ('td', 'tr', 'table'):
+            self.endCell()
+
+    def handle_data(self, data):
+        if self.pre is not None:
+            self.pre.append(data)
+
+    def endPre(self):
+        # only the text right at the start of a pre element is a statement
+        if self.pre:
+            self.cell[1].append(''.join(self.pre))
+        self.pre = None
+
+    def endCell(self):
+        self.endPre()
+        if self.cell is not None:
+            self.cells.append(self.cell)
+            self.cell = None
+
+    def close(self):
+        HTMLParser.close(self)
+        self.endCell()
+
+
+def iterConflictCells(fileName: str, statements: bool = False):
+    """
+    Yields the title and statements of the conflict cells of an HTML file,
+    see ConflictCellParser. The file is parsed in one pass, CHUNK_SIZE
+    characters at a time, so it never is held in memory as a whole.
+    """
+    parser = ConflictCellParser(statements)
+    with open(fileName, 'r') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(chunk)
+            yield from parser.cells
+            parser.cells.clear()
+    parser.close()
+    yield from parser.cells
+
+
+class ConflictSet(Mapping):
+    """
+    Conflicts of the nodes, by node id, stored as compressed sparse rows.
+    The nodes having conflicts are numbered densely, in the order of their
+    ids: ids[i] is the id of the row i, and the ids the row i is in conflict
+    with are conflicts[offsets[i]:offsets[i + 1]], sorted. rows maps the
+    ids back to their rows.
+
+    Memory and time only grow with the nodes having conflicts and their
+    conflicts, whatever the ids.
+
+    As a mapping, it maps the ids of the nodes having conflicts to the ids
+    of the nodes they are in conflict with, so it can stand in for a dict
+    of lists of ids.
+    """
+
+    TYPECODE = 'q'
+
+    def __init__(self, ids=None, offsets=None, conflicts=None):
+        self.ids = ids if ids is not None else array(self.TYPECODE)
+        self.offsets = offsets if offsets is not None else array(self.TYPECODE, [0])
+        self.conflicts = conflicts if conflicts is not None else array(self.TYPECODE)
+        self.rows = {nodeId: row for row, nodeId in enumerate(self.ids)}
+
+    @classmethod
+    def fromPairs(cls, keys, values):
+        """
+        Returns the set of the conflicts of keys[i] with values[i], for all
+        i. Duplicates are dropped.
+        """
+        ids = array(cls.TYPECODE, sorted(set(keys)))
+        rows = {nodeId: row for row, nodeId in enumerate(ids)}
+        n = len(ids)
+        # counting sort of the values by row
+        offsets = array(cls.TYPECODE, bytes(8 * (n + 1)))
+        for key in keys:
+            offsets[rows[key] + 1] += 1
+        for i in range(n):
+            offsets[i + 1] += offsets[i]
+        conflicts = array(cls.TYPECODE, bytes(8 * len(values)))
+        ends = offsets[:-1]
+        for key, value in zip(keys, values):
+            row = rows[key]
+            conflicts[ends[row]] = value
+            ends[row] += 1
+
+        # sort the rows and drop their duplicates, moving them down in place
+        end = 0
+        for i in range(n):
+            start, stop = offsets[i], offsets[i + 1]
+            offsets[i] = end
+            row = sorted(set(conflicts[start:stop]))
+            conflicts[end:end + len(row)] = array(cls.TYPECODE, row)
+            end += len(row)
+        offsets[n] = end
+        del conflicts[end:]
+        return cls(ids, offsets, conflicts)
+
+    def degree(self, nodeId):
+        """Returns the number of nodes nodeId is in conflict with."""
+        row = self.rows.get(nodeId)
+        if row is None:
+            return 0
+        return self.offsets[row + 1] - self.offsets[row]
+
+    def conflicts_of(self, nodeId):
+        """Returns the ids of the nodes nodeId is in conflict with, in increasing order."""
+        row = self.rows.get(nodeId)
+        if row is None:
+            return array(self.TYPECODE)
+        return self.conflicts[self.offsets[row]:self.offsets[row + 1]]
+
+    def are_conflicting(self, a, b):
+        """Returns whether a is in conflict with b, as the conflict file has it."""
+        row = self.rows.get(a)
+        if row is None:
+            return False
+        start, stop = self.offsets[row], self.offsets[row + 1]
+        i = bisect_left(self.conflicts, b, start, stop)
+        return i < stop and self.conflicts[i] == b
+
+    def __getitem__(self, nodeId):
+        if nodeId not in self.rows:
+            raise KeyError(nodeId)
+        return self.conflicts_of(nodeId)
+
+    def __contains__(self, nodeId):
+        return nodeId in self.rows
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def generateMap(fileName: str) -> ConflictSet:
+    """
+    returns the set of nodeId to nodeIds which the key node is in conflict in, see ConflictSet
+    """
+    keys = array(ConflictSet.TYPECODE)
+    values = array(ConflictSet.TYPECODE)
+    for title, statements in iterConflictCells(fileName):
+        key, value = getTags(title)
+        if key == value:
+            continue
+
+        keys.append(key)
+        values.append(value)
+    return ConflictSet.fromPairs(keys, values)
+
+def generateFullMap(fileName: str) -> Dict[int, List[int]]:
+    result = {}
+    for title, statements in iterConflictCells(fileName, statements=True):
+        key, value = getTags(title)
+        if key == value:
+            continue
+
+        c = ConflictNode(value, statements)
+        if key in result:
+            x = result[key]
+            x.add(c)
+        else:
+            result[key] = {c}
+    return result
+
+
+class ConflictNode:
+    def __init__(self, nodeId, statements):
+        self.nodeId = nodeId
+        self.statements = statements
+
+    def __eq__(self, other):
+        if isinstance(other, ConflictNode):
+            return other.nodeId == self.nodeId
+        return False
+ 
+    def __hash__(self):
+        return hash(self.nodeId)
+
+ 
@@ -0,0 +1,26 @@
+import subprocess
+
+
+def run_filter(filter: str, dotcode: bytes):
+    """
+    Lays out dotcode with the given graphviz filter (dot, neato, ...).
+
+    Returns the xdot code, or None if the filter failed, along with whatever
+    the filter wrote to its standard error.
+    """
+    try:
+        p = subprocess.Popen(
+            [filter, '-Txdot'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+            universal_newlines=False
+        )
+    except OSError as exc:
+        return None, '%s: %s' % (filter, exc.strerror)
+    xdotcode, error = p.communicate(dotcode)
+    error = error.decode().rstrip()
+    if p.returncode != 0:
+        return None, error
+    return xdotcode, error
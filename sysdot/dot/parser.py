@@ -513,7 +513,8 @@ class XDotParser(DotParser):
     def parse(self):
         DotParser.parse(self)
         return elements.Graph(self.width, self.height, self.shapes,
-                              self.nodes, self.edges, self.outputorder)
+                              self.nodes, self.edges, self.outputorder,
+                              node_by_id=self.node_by_name)
 
     def parse_node_pos(self, pos):
         x, y = pos.split(b",")
@@ -0,0 +1,303 @@
+'''
+Renders graphs to PNG, SVG or PDF files without opening any window.
+
+    python3 -m sysdot export -T svg -o out/ graphs/*.dot
+    python3 -m sysdot export -cf conflicts.html --highlight 3,7-9 graph.dot
+    python3 -m sysdot export --scale 8 --tiled huge.dot
+'''
+
+import argparse
+import multiprocessing
+import os
+import struct
+import sys
+import zlib
+
+import cairo
+
+from .dot.filter import run_filter
+from .dot.lexer import ParseError
+from .dot.parser import XDotParser
+from .conflicts import mapper
+from .conflicts import dotCreater
+from .ui.elements import set_level_of_detail
+
+
+FORMATS = ('png', 'svg', 'pdf')
+MARGIN = 12  # pixels/points around the graph
+# largest image cairo can render at once, bigger PNGs are rendered in tiles
+MAX_IMAGE_SIZE = 32767
+TILE_SIZE = 1024  # pixels
+# bytes of RGB rows rendered before they are written out, see render_tiled_png
+BAND_BUDGET = 32 << 20
+
+# conflict map of the worker process, see _init_worker, or why it could
+# not be loaded
+_conflicts = {}
+_conflicts_error = None
+
+
+def get_highlight_items(graph, conflicts, highlightIds=None):
+    """
+    Returns the nodes to highlight. These are the nodes with the given ids if
+    any, else all the nodes having conflicts. Their conflicting nodes are
+    highlighted along with them by Graph.draw_highlight.
+    """
+    if highlightIds is None:
+        highlightIds = conflicts.keys()
+    return {graph.node_by_int[nodeId] for nodeId in highlightIds if nodeId in graph.node_by_int}
+
+
+def get_image_size(graph, scale=1.0):
+    """Returns the size of the graph rendered at scale, with its margin."""
+    return (int(graph.width * scale + 2 * MARGIN),
+            int(graph.height * scale + 2 * MARGIN))
+
+
+def render_graph(graph, fileName, fmt, scale=1.0, highlight_items=None):
+    """Renders the whole graph into fileName, in the given format."""
+    width, height = get_image_size(graph, scale)
+    if fmt == 'png':
+        surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+    elif fmt == 'svg':
+        surface = cairo.SVGSurface(fileName, width, height)
+    elif fmt == 'pdf':
+        surface = cairo.PDFSurface(fileName, width, height)
+    else:
+        raise ValueError('unsupported format %r' % fmt)
+
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(1.0, 1.0, 1.0)
+    cr.paint()
+    cr.translate(MARGIN, MARGIN)
+    cr.scale(scale, scale)
+    # vector output can be zoomed into, so nothing is simplified
+    set_level_of_detail(fmt == 'png')
+    try:
+        graph.draw(cr)
+        graph.draw_highlight(cr, highlight_items)
+    finally:
+        set_level_of_detail(True)
+
+    if fmt == 'png':
+        surface.write_to_png(fileName)
+    surface.finish()
+
+
+class PNGWriter:
+    """
+    Writes an 8 bits RGB PNG file row by row, so the image never has to be
+    held in memory as a whole.
+    """
+
+    def __init__(self, f, width, height):
+        self.f = f
+        self.compressor = zlib.compressobj()
+        f.write(b'\x89PNG\r\n\x1a\n')
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+
+    def write_row(self, row):
+        # each row starts with its filter type, none here
+        self._write_data(self.compressor.compress(b'\x00'))
+        self._write_data(self.compressor.compress(row))
+
+    def close(self):
+        self._write_data(self.compressor.flush())
+        self._write_chunk(b'IEND', b'')
+
+    def _write_data(self, data):
+        if data:
+            self._write_chunk(b'IDAT', data)
+
+    def _write_chunk(self, kind, data):
+        self.f.write(struct.pack('>I', len(data)))
+        self.f.write(kind)
+        self.f.write(data)
+        self.f.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(kind))))
+
+
+def _render_tile_rgb(graph, x0, y0, width, height, scale, highlight_items):
+    # Renders the width x height pixels of the image at (x0, y0), and returns
+    # them as packed RGB bytes.
+    surface = cairo.ImageSurface(cairo.FORMAT_RGB24, width, height)
+    cr = cairo.Context(surface)
+    cr.set_source_rgb(1.0, 1.0, 1.0)
+    cr.paint()
+    cr.translate(MARGIN - x0, MARGIN - y0)
+    cr.scale(scale, scale)
+    bounding = ((x0 - MARGIN) / scale, (y0 - MARGIN) / scale,
+                (x0 + width - MARGIN) / scale, (y0 + height - MARGIN) / scale)
+    graph.draw(cr, bounding=bounding)
+    graph.draw_highlight(cr, highlight_items, bounding)
+    surface.flush()
+
+    # Pixels are native endian 32 bits words, without row padding as they
+    # are already 32 bits aligned.
+    data = bytes(surface.get_data())
+    rgb = bytearray(width * height * 3)
+    if sys.byteorder == 'little':
+        rgb[0::3], rgb[1::3], rgb[2::3] = data[2::4], data[1::4], data[0::4]
+    else:
+        rgb[0::3], rgb[1::3], rgb[2::3] = data[1::4], data[2::4], data[3::4]
+    surface.finish()
+    return rgb
+
+
+def render_tiled_png(graph, fileName, scale=1.0, highlight_items=None, tile_size=TILE_SIZE,
+                     band_budget=BAND_BUDGET):
+    """
+    Renders the whole graph into the PNG file fileName, tile by tile. Tiles
+    are rendered a band of rows at a time, as many rows as fit in
+    band_budget bytes, and each band is written out before the next one is
+    rendered, so the memory used is bounded whatever the image size.
+    """
+    width, height = get_image_size(graph, scale)
+    band_height = max(1, min(tile_size, band_budget // (width * 3)))
+    with open(fileName, 'wb') as f:
+        writer = PNGWriter(f, width, height)
+        for y0 in range(0, height, band_height):
+            rows = min(band_height, height - y0)
+            band = [bytearray(width * 3) for i in range(rows)]
+            for x0 in range(0, width, tile_size):
+                columns = min(tile_size, width - x0)
+                rgb = _render_tile_rgb(graph, x0, y0, columns, rows, scale, highlight_items)
+                span = columns * 3
+                for y in range(rows):
+                    band[y][x0 * 3:x0 * 3 + span] = rgb[y * span:(y + 1) * span]
+            for row in band:
+                writer.write_row(row)
+        writer.close()
+
+
+def export_file(inputfile, outputfile, fmt, filter='dot', scale=1.0,
+                conflicts=None, highlightIds=None, tiled=False):
+    """
+    Lays out and renders a dot (or, without filter, xdot) file into
+    outputfile, highlighting its conflicts if a conflict map is given.
+
+    PNG images are rendered in tiles if tiled is true, or if they are too
+    big for cairo.
+    """
+    with open(inputfile, 'rb') as f:
+        code = f.read()
+    if filter:
+        code, error = run_filter(filter, code)
+        if code is None:
+            raise RuntimeError(error)
+    graph = XDotParser(code).parse()
+
+    highlight_items = None
+    if conflicts:
+        graph.set_conflicting_nodes(conflicts)
+        highlight_items = get_highlight_items(graph, conflicts, highlightIds)
+    elif highlightIds is not None:
+        highlight_items = get_highlight_items(graph, {}, highlightIds)
+    if fmt == 'png' and (tiled or max(get_image_size(graph, scale)) > MAX_IMAGE_SIZE):
+        render_tiled_png(graph, outputfile, scale, highlight_items)
+    else:
+        render_graph(graph, outputfile, fmt, scale, highlight_items)
+
+
+def _init_worker(conflictFile):
+    # Each worker loads the conflict file once, rather than receiving the
+    # whole map with every file to export.
+    # An initializer that raises gets the pool to respawn its workers over
+    # and over, so the error is reported by every task instead.
+    global _conflicts, _conflicts_error
+    if conflictFile:
+        try:
+            _conflicts = mapper.generateMap(conflictFile)
+        except Exception as ex:
+            _conflicts_error = '%s: %s' % (conflictFile, ex)
+
+
+def _export_task(task):
+    inputfile, outputfile, fmt, filter, scale, highlightIds, tiled = task
+    if _conflicts_error is not None:
+        return inputfile, _conflicts_error
+    try:
+        export_file(inputfile, outputfile, fmt, filter, scale, _conflicts, highlightIds, tiled)
+    except (IOError, OSError, RuntimeError, ParseError) as ex:
+        return inputfile, str(ex)
+    except Exception as ex:
+        # reported like the others, rather than taking the whole pool down
+        return inputfile, '%s: %s' % (type(ex).__name__, ex)
+    return inputfile, None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='sysdot export',
+        description='Renders graphs to image files, without opening any window.')
+    parser.add_argument(
+        'inputfiles', metavar='file', nargs='+',
+        help='graphs to render')
+    parser.add_argument(
+        '-T', '--format', choices=FORMATS, default='png',
+        help='output format [default: %(default)s]')
+    parser.add_argument(
+        '-o', '--output-dir', metavar='DIR', default='.',
+        help='directory the files are written to, named after the inputs [default: %(default)s]')
+    parser.add_argument(
+        '-s', '--scale', type=float, default=1.0,
+        help='pixels (or points) per graph point [default: %(default)s]')
+    parser.add_argument(
+        '--tiled', action='store_true',
+        help='render PNG images tile by tile, streaming them to the file; '
+             'done anyway for images larger than %d pixels' % MAX_IMAGE_SIZE)
+    parser.add_argument(
+        '-cf', '--conflictFile', metavar='conflictFile',
+        dest='conflictFile', help='HTML file containing conflicts to highlight')
+    parser.add_argument(
+        '--highlight', metavar='NODES',
+        help='highlight only these nodes and their conflicts, e.g. "1,2,5-10" '
+             '[default: all the nodes having conflicts]')
+    parser.add_argument(
+        '-f', '--filter', choices=['dot', 'neato', 'twopi', 'circo', 'fdp'],
+        dest='filter', default='dot', metavar='FILTER',
+        help='graphviz filter: dot, neato, twopi, circo, or fdp [default: %(default)s]')
+    parser.add_argument(
+        '-n', '--no-filter',
+        action='store_const', const=None, dest='filter',
+        help='assume input is already filtered into xdot format (use e.g. dot -Txdot)')
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=os.cpu_count() or 1,
+        help='number of files rendered in parallel [default: %(default)s]')
+    options = parser.parse_args(argv)
+
+    highlightIds = None
+    if options.highlight:
+        highlightIds = dotCreater.parseNodes(options.highlight)
+
+    tasks = []
+    outputs = {}
+    for inputfile in options.inputfiles:
+        name = os.path.splitext(os.path.basename(inputfile))[0]
+        outputfile = os.path.join(options.output_dir, name + '.' + options.format)
+        if outputfile in outputs:
+            parser.error('%s and %s would both be written to %s' %
+                         (outputs[outputfile], inputfile, outputfile))
+        outputs[outputfile] = inputfile
+        tasks.append((inputfile, outputfile, options.format, options.filter,
+                      options.scale, highlightIds, options.tiled))
+    os.makedirs(options.output_dir, exist_ok=True)
+
+    jobs = max(1, min(options.jobs, len(tasks)))
+    if jobs == 1:
+        _init_worker(options.conflictFile)
+        results = map(_export_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(jobs, _init_worker, (options.conflictFile,))
+        results = pool.imap_unordered(_export_task, tasks)
+
+    failures = 0
+    for inputfile, error in results:
+        if error is not None:
+            sys.stderr.write('%s: %s\n' % (inputfile, error))
+            failures += 1
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return 1 if failures else 0
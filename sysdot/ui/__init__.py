@@ -1,3 +1,10 @@
 __all__ = ['actions', 'animation', 'colors', 'elements', 'pen', 'window']
 
-from .window import DotWidget, DotWindow
+
+def __getattr__(name):
+    # The window needs Gtk, which drawing graphs off screen does not, so it
+    # is only imported once used.
+    if name in ('DotWidget', 'DotWindow'):
+        from . import window
+        return getattr(window, name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
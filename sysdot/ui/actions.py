@@ -85,12 +85,14 @@ class PanAction(DragAction):
         self.dot_widget.get_window().set_cursor(Gdk.Cursor(Gdk.CursorType.FLEUR))
 
     def drag(self, deltax, deltay):
+        self.dot_widget.interact()
         self.dot_widget.x += deltax / self.dot_widget.zoom_ratio
         self.dot_widget.y += deltay / self.dot_widget.zoom_ratio
         self.dot_widget.queue_draw()
 
     def stop(self):
         self.dot_widget.get_window().set_cursor(None)
+        self.dot_widget.end_interaction()
 
     abort = stop
 
@@ -98,11 +100,13 @@ class PanAction(DragAction):
 class ZoomAction(DragAction):
 
     def drag(self, deltax, deltay):
+        self.dot_widget.interact()
         self.dot_widget.zoom_ratio *= 1.005 ** (deltax + deltay)
         self.dot_widget.zoom_to_fit_on_resize = False
         self.dot_widget.queue_draw()
 
     def stop(self):
+        self.dot_widget.end_interaction()
         self.dot_widget.queue_draw()
 
 
@@ -14,7 +14,6 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 #
 import math
-import time
 
 import gi
 gi.require_version('Gtk', '3.0')
@@ -24,33 +23,37 @@ from gi.repository import GLib
 
 
 class Animation(object):
-
-    step = 0.03  # seconds
+    """
+    Animations are stepped by the frame clock of the widget, once per frame
+    it paints, so they never queue more frames than can be shown.
+    """
 
     def __init__(self, dot_widget):
         self.dot_widget = dot_widget
-        self.timeout_id = None
+        self.tick_id = None
 
     def start(self):
-        self.timeout_id = GLib.timeout_add(int(self.step * 1000), self.__real_tick)
+        self.tick_id = self.dot_widget.add_tick_callback(self.__real_tick)
 
     def stop(self):
         self.dot_widget.animation = NoAnimation(self.dot_widget)
-        if self.timeout_id is not None:
-            GLib.source_remove(self.timeout_id)
-            self.timeout_id = None
+        if self.tick_id is not None:
+            self.dot_widget.remove_tick_callback(self.tick_id)
+            self.tick_id = None
 
-    def __real_tick(self):
+    def __real_tick(self, widget, frame_clock):
         try:
-            if not self.tick():
+            # time of the frame being prepared, in seconds
+            if not self.tick(frame_clock.get_frame_time() * 1e-6):
+                self.tick_id = None
                 self.stop()
-                return False
+                return GLib.SOURCE_REMOVE
         except AttributeError as e:
             self.stop()
             raise e
-        return True
+        return GLib.SOURCE_CONTINUE
 
-    def tick(self):
+    def tick(self, frame_time):
         return False
 
 
@@ -68,11 +71,14 @@ class LinearAnimation(Animation):
     duration = 0.6
 
     def start(self):
-        self.started = time.time()
+        self.started = None
         Animation.start(self)
 
-    def tick(self):
-        t = (time.time() - self.started) / self.duration
+    def tick(self, frame_time):
+        # the first frame shows the start of the animation
+        if self.started is None:
+            self.started = frame_time
+        t = (frame_time - self.started) / self.duration
         self.animate(max(0, min(t, 1)))
         return (t < 1)
 
@@ -82,13 +88,43 @@ class LinearAnimation(Animation):
 
 class MoveToAnimation(LinearAnimation):
 
+    # number of steps the path is sampled at, to find all it shows
+    PREVIEW_STEPS = 16
+
     def __init__(self, dot_widget, target_x, target_y):
         Animation.__init__(self, dot_widget)
         self.source_x = dot_widget.x
         self.source_y = dot_widget.y
+        self.source_zoom = dot_widget.zoom_ratio
         self.target_x = target_x
         self.target_y = target_y
 
+    def zoom_at(self, t):
+        """Returns the zoom ratio of the view at time t, from 0 to 1."""
+        return self.source_zoom
+
+    def start(self):
+        # Until the animation ends, the widget just moves and scales an image
+        # of everything shown along the way.
+        rect = self.dot_widget.get_allocation()
+        sx, sy = self.source_x, self.source_y
+        tx, ty = self.target_x, self.target_y
+        x0 = y0 = math.inf
+        x1 = y1 = -math.inf
+        for i in range(self.PREVIEW_STEPS + 1):
+            t = i / self.PREVIEW_STEPS
+            x, y = tx * t + sx * (1 - t), ty * t + sy * (1 - t)
+            zoom = self.zoom_at(t)
+            dx, dy = 0.5 * rect.width / zoom, 0.5 * rect.height / zoom
+            x0, y0 = min(x0, x - dx), min(y0, y - dy)
+            x1, y1 = max(x1, x + dx), max(y1, y + dy)
+        self.dot_widget.begin_preview((x0, y0, x1, y1))
+        LinearAnimation.start(self)
+
+    def stop(self):
+        LinearAnimation.stop(self)
+        self.dot_widget.end_preview()
+
     def animate(self, t):
         sx, sy = self.source_x, self.source_y
         tx, ty = self.target_x, self.target_y
@@ -101,7 +137,6 @@ class ZoomToAnimation(MoveToAnimation):
 
     def __init__(self, dot_widget, target_x, target_y):
         MoveToAnimation.__init__(self, dot_widget, target_x, target_y)
-        self.source_zoom = dot_widget.zoom_ratio
         self.target_zoom = self.source_zoom
         self.extra_zoom = 0
 
@@ -116,8 +151,12 @@ class ZoomToAnimation(MoveToAnimation):
             desired_middle_zoom = visible / distance
             self.extra_zoom = min(0, 4 * (desired_middle_zoom - middle_zoom))
 
-    def animate(self, t):
+    def zoom_at(self, t):
+        # zoomed out the most half way, to source_zoom + extra_zoom/4
         a, b, c = self.source_zoom, self.extra_zoom, self.target_zoom
-        self.dot_widget.zoom_ratio = c*t + b*t*(1 - t) + a*(1 - t)
+        return c*t + b*t*(1 - t) + a*(1 - t)
+
+    def animate(self, t):
+        self.dot_widget.zoom_ratio = self.zoom_at(t)
         self.dot_widget.zoom_to_fit_on_resize = False
         MoveToAnimation.animate(self, t)
@@ -0,0 +1,66 @@
+try:
+    import numpy
+except ImportError:
+    # Culling and hit-testing then go through the elements one by one.
+    numpy = None
+
+
+class ElementColumns:
+    """
+    Geometry of the nodes and edges of a graph, as NumPy columns in the order
+    of graph.nodes and graph.edges. Culling and hit-testing are then array
+    operations, and only the elements they find are looked at.
+    """
+
+    def __init__(self, nodes, edges):
+        # finite extents, for culling, as the bounding of text is unbounded
+        # in height
+        self.node_bounds = self._array([node.extents for node in nodes], 4)
+        # node boxes, for hit-testing
+        self.node_boxes = self._array([(node.x1, node.y1, node.x2, node.y2) for node in nodes], 4)
+        self.edge_bounds = self._array([edge.extents for edge in edges], 4)
+        # first and last points, for hit-testing
+        nan = float('nan')
+        self.edge_ends = self._array([edge.points[0] + edge.points[-1] if edge.points else (nan,) * 4
+                                      for edge in edges], 4)
+
+    @staticmethod
+    def _array(rows, columns):
+        return numpy.array(rows, dtype=float).reshape(-1, columns)
+
+    @staticmethod
+    def _intersecting(bounds, bounding):
+        x0, y0, x1, y1 = bounding
+        mask = ((bounds[:, 0] <= x1) & (x0 <= bounds[:, 2]) &
+                (bounds[:, 1] <= y1) & (y0 <= bounds[:, 3]))
+        return numpy.flatnonzero(mask)
+
+    def visible_nodes(self, bounding):
+        """Returns the indices of the nodes intersecting bounding."""
+        return self._intersecting(self.node_bounds, bounding)
+
+    def visible_edges(self, bounding):
+        """Returns the indices of the edges intersecting bounding."""
+        return self._intersecting(self.edge_bounds, bounding)
+
+    @staticmethod
+    def _first(mask):
+        i = int(numpy.argmax(mask)) if len(mask) else 0
+        return i if len(mask) and mask[i] else None
+
+    def node_at(self, x, y):
+        """Returns the index of the first node whose box holds (x, y), if any."""
+        boxes = self.node_boxes
+        return self._first((boxes[:, 0] <= x) & (x <= boxes[:, 2]) &
+                           (boxes[:, 1] <= y) & (y <= boxes[:, 3]))
+
+    def edge_end_at(self, x, y, radius):
+        """
+        Returns the index of the first edge with an end point within radius
+        of (x, y), if any.
+        """
+        ends = self.edge_ends
+        r2 = radius * radius
+        begin = (ends[:, 0] - x) ** 2 + (ends[:, 1] - y) ** 2 <= r2
+        end = (ends[:, 2] - x) ** 2 + (ends[:, 3] - y) ** 2 <= r2
+        return self._first(begin | end)
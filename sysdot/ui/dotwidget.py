@@ -1,6 +1,5 @@
 
 import os
-import subprocess
 import sys
 import time
 import math
@@ -13,14 +12,21 @@ from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Gdk
+import cairo
 
 from ..dot.lexer import ParseError
 from ..dot.parser import XDotParser
+from ..dot.filter import run_filter
 from . import animation
 from . import actions
+from . import renderer
+from . import stats
+from . import tiles
+from .layouts import get_layout_cache
 
 from .elements import Graph
 from .elements import Node
+from .elements import set_frame_stats
 
 from ..conflicts import mapper
 from ..conflicts import dotCreater 
@@ -38,14 +44,18 @@ class DotWidget(Gtk.DrawingArea):
         'error': (GObject.SIGNAL_RUN_LAST, None, (str,)),
         'history': (GObject.SIGNAL_RUN_LAST, None, (bool, bool)),
         'node-highlighted': (GObject.SIGNAL_RUN_LAST, None, (int,)),
+        # emitted after drawing a view different from the previous one
+        'view-changed': (GObject.SIGNAL_RUN_LAST, None, ()),
         'conflict-button-pressed': (GObject.SIGNAL_RUN_FIRST, None, ())
     }
 
     filter = 'dot'
+    batch_pens = False
 
     def set_conflict_graph(self, conflictGraph):
         self.conflict_nodes = conflictGraph
         self.graph.set_conflicting_nodes(conflictGraph)
+        self.invalidate()
 
         # Initialize the sidebar as well.
         self.sidebar.set_nodes_and_edges(self.graph)
@@ -57,10 +67,11 @@ class DotWidget(Gtk.DrawingArea):
         self.set_hexpand(True)
         self.graph = Graph()
         self.graph.conflictModeOff = True
+        self.original_graph = None
         self.openfilename = None
         self.set_can_focus(True)
-        ## conflict_nodes is {int: list(int)}; id to list of ids
-        self.conflict_nodes = {}
+        ## conflict_nodes maps ids to the ids they conflict with, see mapper.ConflictSet
+        self.conflict_nodes = mapper.ConflictSet()
         self.conflictMode = ConflictMode.OFF
 
         self.connect("draw", self.on_draw)
@@ -93,6 +104,24 @@ class DotWidget(Gtk.DrawingArea):
         self.highlight_search = False
         self.history_back = []
         self.history_forward = []
+        self.tile_cache = tiles.TileCache()
+        # set when rendering on a background thread
+        self.render_worker = None
+        self.frame = None
+        self.snapshot = None
+        self.requested = None
+        # set once instrumentation was turned on, and kept when it is turned
+        # off so the frames recorded can still be dumped
+        self.stats = None
+        self.instrumented = False
+        # whether the overlay was queued for redrawing, see on_draw
+        self.stats_refresh = False
+        # set while animating or interacting, see begin_preview
+        self.preview = None
+        # renders the margins of interaction previews, see schedule_preview
+        self.preview_worker = None
+        self.interaction_id = None
+        self.last_viewport = None
 
     def error_dialog(self, message):
         self.emit('error', message)
@@ -124,6 +153,7 @@ class DotWidget(Gtk.DrawingArea):
             self.graph = self.original_graph
             self.graph.selectedNodes = set()
             self.graph.conflictModeOff = True
+            self.tile_cache.invalidate()
 
             self.zoom_image(self.zoom_ratio, center=True)
 
@@ -135,27 +165,11 @@ class DotWidget(Gtk.DrawingArea):
     def run_filter(self, dotcode):
         if not self.filter:
             return dotcode
-        try:
-            p = subprocess.Popen(
-                [self.filter, '-Txdot'],
-                stdin=subprocess.PIPE,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                shell=False,
-                universal_newlines=False
-            )
-        except OSError as exc:
-            error = '%s: %s' % (self.filter, exc.strerror)
-            p = subprocess.CalledProcessError(exc.errno, self.filter, exc.strerror)
-        else:
-            xdotcode, error = p.communicate(dotcode)
-            error = error.decode()
-        error = error.rstrip()
+        xdotcode, error = run_filter(self.filter, dotcode)
         if error:
             sys.stderr.write(error + '\n')
-        if p.returncode != 0:
+        if xdotcode is None:
             self.error_dialog(error)
-            return None
         return xdotcode
 
     def _set_dotcode(self, dotcode, center=True):
@@ -185,12 +199,15 @@ class DotWidget(Gtk.DrawingArea):
     def parse_graph_from_dotcode(self, dotcode: bytes):
         xdotcode = self.run_filter(dotcode)
         parser = XDotParser(xdotcode)
-        return parser.parse()
+        graph = parser.parse()
+        graph.batch_pens = self.batch_pens
+        return graph
         
     def set_xdotcode(self, xdotcode, center=True):
         assert isinstance(xdotcode, bytes)
         parser = XDotParser(xdotcode)
         self.graph = parser.parse()
+        self.graph.batch_pens = self.batch_pens
         self.graph.set_conflicting_nodes(self.conflict_nodes)
         self.original_graph = self.graph
         self.zoom_image(self.zoom_ratio, center=center)
@@ -227,18 +244,107 @@ class DotWidget(Gtk.DrawingArea):
         cr.translate(-x, -y)
         self.graph.draw(cr, highlight_items=self.highlight, bounding=bounding)
 
+    def _draw_graph_tiled(self, cr, rect, cached_only=False):
+        w, h = float(rect.width), float(rect.height)
+        ratio = self.zoom_ratio
+        x0, y0 = self.x - 0.5 * w / ratio, self.y - 0.5 * h / ratio
+        self.tile_cache.draw(cr, self.graph, x0, y0, ratio, rect.width, rect.height, cached_only)
+
+    def _draw_preview(self, cr, rect):
+        viewport = self.get_viewport()
+        preview = self.preview
+        if not preview.covers(viewport.get_bounding()):
+            # what the preview misses is painted from the tiles at hand
+            x0, y0, x1, y1 = preview.viewport.get_bounding()
+            wx0, wy0 = self.graph2window(x0, y0)
+            wx1, wy1 = self.graph2window(x1, y1)
+            cr.save()
+            cr.rectangle(0, 0, rect.width, rect.height)
+            cr.rectangle(wx0, wy0, wx1 - wx0, wy1 - wy0)
+            cr.set_fill_rule(cairo.FILL_RULE_EVEN_ODD)
+            cr.clip()
+            self._draw_graph_tiled(cr, rect, cached_only=True)
+            cr.restore()
+        preview.paint(cr, viewport)
+
+    def _draw_highlight(self, cr, rect):
+        # only what is within the area being redrawn
+        x0, y0, x1, y1 = cr.clip_extents()
+        bounding = self.window2graph(x0, y0) + self.window2graph(x1, y1)
+
+        cr.translate(0.5 * rect.width, 0.5 * rect.height)
+        cr.scale(self.zoom_ratio, self.zoom_ratio)
+        cr.translate(-self.x, -self.y)
+        self.graph.draw_highlight(cr, self.highlight, bounding=bounding)
+
+    def set_instrumentation(self, enabled=True):
+        """
+        Records statistics about every frame drawn, and shows the ones of the
+        last frame over the graph.
+        """
+        if enabled and self.stats is None:
+            self.stats = stats.FrameStats()
+        self.instrumented = enabled
+        self.queue_draw()
+
     def on_draw(self, widget, cr):
+        frame_stats = self.stats
+        if not self.instrumented:
+            self._draw(cr)
+        elif self.stats_refresh and frame_stats.overlay_covers(cr.clip_extents()):
+            # only repainting the overlay, which is not a frame of its own
+            self.stats_refresh = False
+            self._draw(cr)
+            frame_stats.draw_overlay(cr)
+        else:
+            layout_misses = get_layout_cache().layouts.misses
+            set_frame_stats(frame_stats)
+            frame_stats.begin_frame()
+            try:
+                self._draw(cr)
+            finally:
+                frame_stats.add('layouts_created', get_layout_cache().layouts.misses - layout_misses)
+                frame_stats.end_frame()
+                set_frame_stats(None)
+            previous = frame_stats.overlay_rect
+            x, y, w, h = frame_stats.draw_overlay(cr)
+            # The numbers changed, but a partial redraw only painted the part
+            # of the overlay within its area.
+            x0, y0, x1, y1 = cr.clip_extents()
+            if not (x0 <= x and y0 <= y and x + w <= x1 and y + h <= y1):
+                if previous is not None:
+                    w, h = max(w, previous[2]), max(h, previous[3])
+                self.stats_refresh = True
+                self.queue_draw_area(int(x), int(y), int(math.ceil(w)) + 1, int(math.ceil(h)) + 1)
+
+        viewport = self.get_viewport()
+        if viewport != self.last_viewport:
+            self.last_viewport = viewport
+            self.emit('view-changed')
+        return False
+
+    def _draw(self, cr):
         rect = self.get_allocation()
         Gtk.render_background(self.get_style_context(), cr, 0, 0,
                               rect.width, rect.height)
 
+        # The tiles and frames hold the graph without highlight, which is
+        # drawn on top.
         cr.save()
-        self._draw_graph(cr, rect)
+        if self.preview is not None:
+            self._draw_preview(cr, rect)
+        elif self.render_worker is not None:
+            self._draw_graph_threaded(cr)
+        else:
+            self._draw_graph_tiled(cr, rect)
         cr.restore()
 
-        self.drag_action.draw(cr)
+        if self.highlight:
+            cr.save()
+            self._draw_highlight(cr, rect)
+            cr.restore()
 
-        return False
+        self.drag_action.draw(cr)
 
     def get_current_pos(self):
         return self.x, self.y
@@ -255,10 +361,221 @@ class DotWidget(Gtk.DrawingArea):
         # Ignore cursor highlight while searching
         if self.highlight_search and not search:
             return
+        # membership is tested for every element drawn, and add_highlight
+        # updates the set in place, so keep a copy of our own
+        if items is not None:
+            items = set(items)
         if self.highlight != items:
+            # Only the overlay changes, so only redraw where the old and new
+            # highlighted elements are.
+            extents = [e for e in (self.graph.get_highlight_extents(self.highlight),
+                                   self.graph.get_highlight_extents(items))
+                       if e is not None]
             self.highlight = items
+            if extents:
+                self.queue_draw_graph_area(*Graph._envelope_bounds(extents))
+
+    def add_highlight(self, items, search=False):
+        """
+        Highlights items along with the ones already highlighted, updating
+        the highlight set in place, and only redraws where the new ones are.
+        """
+        if search:
+            self.highlight_search = True
+        elif self.highlight_search:
+            return
+        if not isinstance(self.highlight, set):
+            self.highlight = set(self.highlight or ())
+        items = [item for item in items if item not in self.highlight]
+        if not items:
+            return
+        self.highlight.update(items)
+        extents = self.graph.get_highlight_extents(items)
+        if extents is not None:
+            self.queue_draw_graph_area(*extents)
+
+    def queue_draw_graph_area(self, x0, y0, x1, y1):
+        """
+        Schedules a redraw of the window area showing the given rectangle, in
+        graph coordinates.
+        """
+        rect = self.get_allocation()
+        pad = 2  # antialiasing and line caps
+        wx0, wy0 = self.graph2window(x0, y0)
+        wx1, wy1 = self.graph2window(x1, y1)
+        wx0 = max(int(math.floor(wx0)) - pad, 0)
+        wy0 = max(int(math.floor(wy0)) - pad, 0)
+        wx1 = min(int(math.ceil(wx1)) + pad, rect.width)
+        wy1 = min(int(math.ceil(wy1)) + pad, rect.height)
+        if wx0 < wx1 and wy0 < wy1:
+            self.queue_draw_area(wx0, wy0, wx1 - wx0, wy1 - wy0)
+
+    def invalidate(self):
+        """
+        Drops the cached tiles of the graph, e.g. after it was changed in
+        place, and schedules a redraw.
+        """
+        self.tile_cache.invalidate()
+        self.snapshot = None
+        self.preview = None
+        self.queue_draw()
+
+    # how many times the window size a preview may be, in each direction
+    PREVIEW_SCALE = 2
+
+    def begin_preview(self, bounding=None):
+        """
+        Renders the current view once, extended to also cover bounding (in
+        graph coordinates) if given, and only moves and scales that image to
+        draw the view from then on, until end_preview is called.
+        """
+        viewport = self._get_preview_viewport(bounding)
+        if viewport is None:
+            return
+        self.preview = renderer.render_tiled_frame(self.tile_cache, self.graph, viewport)
+
+    def _get_preview_viewport(self, bounding=None):
+        """
+        Returns the viewport of a preview of the current view extended to
+        bounding, at most PREVIEW_SCALE times the window size, or None if
+        the window has no size.
+        """
+        viewport = self.get_viewport()
+        if viewport.width <= 0 or viewport.height <= 0:
+            return None
+        if bounding is None:
+            return viewport
+        x0, y0, x1, y1 = viewport.get_bounding()
+        bx0, by0, bx1, by1 = bounding
+        x0, y0, x1, y1 = min(x0, bx0), min(y0, by0), max(x1, bx1), max(y1, by1)
+        zoom_ratio = min(viewport.zoom_ratio,
+                         self.PREVIEW_SCALE * viewport.width / (x1 - x0),
+                         self.PREVIEW_SCALE * viewport.height / (y1 - y0))
+        return renderer.Viewport(0.5 * (x0 + x1), 0.5 * (y0 + y1), zoom_ratio,
+                                 int(math.ceil((x1 - x0) * zoom_ratio)),
+                                 int(math.ceil((y1 - y0) * zoom_ratio)))
+
+    def end_preview(self):
+        """Goes back to rendering the view at full quality."""
+        if self.preview is not None:
+            self.preview = None
+            self.queue_draw()
+
+    # milliseconds without any input before an interaction is considered over
+    INTERACTION_DELAY = 150
+
+    def interact(self):
+        """
+        To be called by user interactions before each change of the view.
+        While they last, the view is drawn from a preview, and it is rendered
+        at full quality again once no change came for INTERACTION_DELAY.
+        """
+        if self.preview is None:
+            # The view as it is, from the tiles it was just drawn from, so
+            # the first frame costs no rendering. The margin is rendered in
+            # the background.
+            self.preview = renderer.render_tiled_frame(self.tile_cache, self.graph,
+                                                       self.get_viewport())
+            self.schedule_preview()
+        elif not self.preview.covers(self._get_preview_bounding(0.25)):
+            # getting close to its edge
+            self.schedule_preview()
+        if self.interaction_id is not None:
+            GLib.source_remove(self.interaction_id)
+        self.interaction_id = GLib.timeout_add(self.INTERACTION_DELAY, self.on_interaction_timeout)
+
+    def _get_preview_bounding(self, margin):
+        """Returns the view extended by margin times its size on each side."""
+        x0, y0, x1, y1 = self.get_viewport().get_bounding()
+        dx, dy = margin * (x1 - x0), margin * (y1 - y0)
+        return x0 - dx, y0 - dy, x1 + dx, y1 + dy
+
+    def schedule_preview(self):
+        """
+        Renders a preview around the current view on a background thread,
+        so interactions keep up meanwhile. It replaces the current preview
+        if the interaction is still going on once it is ready.
+        """
+        # half a window of margin, so short moves show no blank borders
+        viewport = self._get_preview_viewport(self._get_preview_bounding(0.5))
+        if viewport is None:
+            return
+        if self.preview_worker is None:
+            self.preview_worker = renderer.RenderWorker(self.on_preview_rendered)
+        self.preview_worker.request(self._get_snapshot(), viewport)
+
+    def on_preview_rendered(self, frame):
+        if self.preview is not None and self.interaction_id is not None and \
+                frame.graph.source is self.graph:
+            self.preview = frame
             self.queue_draw()
 
+    def on_interaction_timeout(self):
+        self.interaction_id = None
+        self.end_preview()
+        return False
+
+    def end_interaction(self):
+        """Renders the view at full quality right away."""
+        if self.interaction_id is not None:
+            GLib.source_remove(self.interaction_id)
+            self.on_interaction_timeout()
+
+    def set_batch_pens(self, enabled=True):
+        """
+        Draws all the shapes of a layer that share a pen with a single cairo
+        fill or stroke, instead of one per shape.
+        """
+        self.batch_pens = enabled
+        self.graph.batch_pens = enabled
+        if self.original_graph is not None:
+            self.original_graph.batch_pens = enabled
+        self.invalidate()
+
+    def set_threaded_rendering(self, enabled=True):
+        """
+        Renders the graph on a background thread rather than while handling
+        draw events. The last rendered frame is shown meanwhile, moved and
+        scaled to the current view.
+        """
+        if enabled and self.render_worker is None:
+            self.render_worker = renderer.RenderWorker(self.on_frame_rendered)
+        elif not enabled:
+            if self.render_worker is not None:
+                self.render_worker.stop()
+            self.render_worker = None
+            self.frame = self.snapshot = self.requested = None
+        self.queue_draw()
+
+    def on_frame_rendered(self, frame):
+        if self.render_worker is None:
+            return
+        self.frame = frame
+        self.queue_draw()
+
+    def get_viewport(self):
+        rect = self.get_allocation()
+        return renderer.Viewport(self.x, self.y, self.zoom_ratio, rect.width, rect.height)
+
+    def _get_snapshot(self):
+        # the graph as the background threads may draw it, see Graph.snapshot
+        if self.snapshot is None or self.snapshot.source is not self.graph:
+            self.snapshot = self.graph.snapshot()
+        return self.snapshot
+
+    def _draw_graph_threaded(self, cr):
+        viewport = self.get_viewport()
+
+        request = (self._get_snapshot(), viewport)
+        frame = self.frame
+        if (frame is None or (frame.graph, frame.viewport) != request) and \
+                self.requested != request:
+            self.render_worker.request(*request)
+            self.requested = request
+
+        if frame is not None:
+            frame.paint(cr, viewport)
+
     def zoom_image(self, zoom_ratio, center=False, pos=None):
         # Constrain zoom ratio to a sane range to prevent numeric instability.
         zoom_ratio = min(zoom_ratio, 1E4)
@@ -357,9 +674,7 @@ class DotWidget(Gtk.DrawingArea):
             return True
         if event.keyval == Gdk.KEY_f:
             win = widget.get_toplevel()
-            find_toolitem = win.uimanager.get_widget('/ToolBar/Find')
-            textentry = find_toolitem.get_children()
-            win.set_focus(textentry[0])
+            win.set_focus(win.textentry)
             return True
         if event.keyval == Gdk.KEY_q:
             Gtk.main_quit()
@@ -367,6 +682,9 @@ class DotWidget(Gtk.DrawingArea):
         if event.keyval == Gdk.KEY_p:
             self.on_print()
             return True
+        if event.keyval == Gdk.KEY_i:
+            self.set_instrumentation(not self.instrumented)
+            return True
         return False
 
     print_settings = None
@@ -377,6 +695,9 @@ class DotWidget(Gtk.DrawingArea):
         if self.print_settings is not None:
             print_op.set_print_settings(self.print_settings)
 
+        print_op.set_custom_tab_label("Graph")
+        print_op.connect("create-custom-widget", self.create_print_widget)
+        print_op.connect("custom-widget-apply", self.apply_print_widget)
         print_op.connect("begin_print", self.begin_print)
         print_op.connect("draw_page", self.draw_page)
 
@@ -384,14 +705,66 @@ class DotWidget(Gtk.DrawingArea):
         if res == Gtk.PrintOperationResult.APPLY:
             self.print_settings = print_op.get_print_settings()
 
+    # whether the whole graph is printed, over as many pages as needed, and
+    # at which scale
+    print_whole_graph = False
+    print_scale = 1.0
+
+    def create_print_widget(self, operation):
+        grid = Gtk.Grid(row_spacing=6, column_spacing=12, border_width=12)
+        visible = Gtk.RadioButton.new_with_label(None, "Visible part of the graph")
+        whole = Gtk.RadioButton.new_with_label_from_widget(visible, "Whole graph, over several pages")
+        whole.set_active(self.print_whole_graph)
+        scale = Gtk.SpinButton.new_with_range(1, 1000, 5)
+        scale.set_value(self.print_scale * 100)
+        whole.bind_property("active", scale, "sensitive", GObject.BindingFlags.SYNC_CREATE)
+
+        grid.attach(visible, 0, 0, 2, 1)
+        grid.attach(whole, 0, 1, 2, 1)
+        grid.attach(Gtk.Label(label="Scale (%):"), 0, 2, 1, 1)
+        grid.attach(scale, 1, 2, 1, 1)
+        grid.show_all()
+        self.print_options = (whole, scale)
+        return grid
+
+    def apply_print_widget(self, operation, widget):
+        whole, scale = self.print_options
+        self.print_whole_graph = whole.get_active()
+        self.print_scale = scale.get_value() / 100
+
     def begin_print(self, operation, context):
-        operation.set_n_pages(1)
+        if not self.print_whole_graph:
+            operation.set_n_pages(1)
+            return True
+
+        # Graph coordinates are in points, the ones of the context in pixels.
+        ratio = self.print_scale * context.get_dpi_x() / 72.0
+        page_width = context.get_width() / ratio
+        page_height = context.get_height() / ratio
+        columns = max(int(math.ceil(self.graph.width / page_width)), 1)
+        rows = max(int(math.ceil(self.graph.height / page_height)), 1)
+        self.print_pages = (columns, page_width, page_height, ratio)
+        operation.set_n_pages(columns * rows)
         return True
 
     def draw_page(self, operation, context, page_nr):
         cr = context.get_cairo_context()
-        rect = self.get_allocation()
-        self._draw_graph(cr, rect)
+        if not self.print_whole_graph:
+            rect = self.get_allocation()
+            self._draw_graph(cr, rect)
+            return
+
+        # Pages are drawn one at a time, each with only the elements it shows.
+        columns, page_width, page_height, ratio = self.print_pages
+        row, column = divmod(page_nr, columns)
+        x0, y0 = column * page_width, row * page_height
+        bounding = (x0, y0, x0 + page_width, y0 + page_height)
+        cr.rectangle(0, 0, context.get_width(), context.get_height())
+        cr.clip()
+        cr.scale(ratio, ratio)
+        cr.translate(-x0, -y0)
+        self.graph.draw(cr, bounding=bounding)
+        self.graph.draw_highlight(cr, self.highlight, bounding=bounding)
 
     def get_drag_action(self, event):
         state = event.state
@@ -442,7 +815,8 @@ class DotWidget(Gtk.DrawingArea):
                 if isinstance(el, Node):
                     # pass on the nodeId and conflictNodes
                     nodeId = int(el.id)
-                    self.sidebar.emit("highlight", nodeId, self.conflict_nodes[nodeId])
+                    conflicting = self.graph.get_conflicting_nodes(el)
+                    self.sidebar.emit("highlight", nodeId, [int(n.id) for n in conflicting])
 
                 if event.button == 1: # left click
                     jump = self.get_jump(x, y)
@@ -454,13 +828,15 @@ class DotWidget(Gtk.DrawingArea):
             elif self.conflictMode == ConflictMode.SELECTION:
                 if isinstance(el, Node):
                     self.graph.selectedNodes.add(el.id)
-                # do nothing
+                    self.invalidate()
 
         if event.button == 1 or event.button == 2:
             return True
         return False
 
     def on_area_scroll_event(self, area, event):
+        if event.direction in (Gdk.ScrollDirection.UP, Gdk.ScrollDirection.DOWN):
+            self.interact()
         if event.direction == Gdk.ScrollDirection.UP:
             self.zoom_image(self.zoom_ratio * self.ZOOM_INCREMENT,
                             pos=(event.x, event.y))
@@ -532,7 +908,7 @@ class DotWidget(Gtk.DrawingArea):
         x -= self.x
         y -= self.y
         x *= self.zoom_ratio
-        x *= self.zoom_ratio
+        y *= self.zoom_ratio
         x += 0.5*rect.width
         y += 0.5*rect.height
         return x, y
@@ -549,11 +925,7 @@ class DotWidget(Gtk.DrawingArea):
 
     def on_node_highlighted(self, event, nodeId):
         print("This node was highlighted: ", nodeId)
-        node = None
-        for n in self.graph.nodes:
-            if int(n.id) == nodeId:
-                node = n
-                break
+        node = self.graph.node_by_int.get(nodeId)
         self.set_highlight(items=[node])
 
         # TODO: add logic for zooming to that place as well.
@@ -16,12 +16,15 @@
 import math
 import operator
 import copy
+import sys
+import threading
+import time
+import weakref
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('Gdk', '3.0')
 gi.require_version('PangoCairo', '1.0')
 
-from gi.repository import GObject
 from gi.repository import Gdk
 from gi.repository import GdkPixbuf
 from gi.repository import Pango
@@ -29,27 +32,109 @@ from gi.repository import PangoCairo
 import cairo
 
 from sysdot.ui.pen import Pen
+from sysdot.ui.layouts import get_layout_cache
+from sysdot.ui import columns
 
 from typing import Tuple
 from typing import List
 
 _inf = float('inf')
 _get_bounding = operator.attrgetter('bounding')
+_get_extents = operator.attrgetter('extents')
+_local = threading.local()
+# pens shared by all the shapes drawn alike, see _share_pen, for as long as
+# some shape uses them
+_pens = weakref.WeakValueDictionary()
+
+
+def set_frame_stats(stats):
+    """
+    Records rendering statistics for the frames drawn from the calling
+    thread into stats (a FrameStats), or stops recording them if None.
+    """
+    _local.stats = stats
+
+
+def _get_frame_stats():
+    return getattr(_local, 'stats', None)
+
+
+def set_level_of_detail(enabled):
+    """
+    Draws the shapes too small to be seen simplified, from the calling
+    thread, which is the default, or always in full if not enabled, as
+    vector output needs.
+    """
+    _local.lod = enabled
+
+
+def _get_lod_scale(cr):
+    # device pixels per graph unit, for picking the level of detail, or
+    # infinite while it is off
+    if not getattr(_local, 'lod', True):
+        return _inf
+    return math.hypot(*cr.user_to_device_distance(1.0, 0.0))
+
+
+def _share_pen(pen):
+    """
+    Returns a pen equal to pen, shared with every other shape drawn with the
+    same attributes. Shapes never change their pen, so sharing it is safe.
+    """
+    key = tuple(sorted(pen.__dict__.items()))
+    try:
+        return _pens[key]
+    except KeyError:
+        return _pens.setdefault(key, pen.copy())
+
+
+def _get_path_context():
+    """
+    Returns a scratch cairo context with an identity matrix, on which shapes
+    build the paths they cache. Each rendering thread has its own.
+    """
+    try:
+        return _local.path_context
+    except AttributeError:
+        _local.path_context = cairo.Context(cairo.ImageSurface(cairo.FORMAT_A1, 1, 1))
+        return _local.path_context
 
 
 class Shape:
     """Abstract base class for all the drawing shapes."""
+
+    # Shapes and elements have no instance dict, as graphs hold a great many
+    # of them.
+    __slots__ = ('pen', 'highlight_pen')
+
     bounding = (-_inf, -_inf, _inf, _inf)
 
     def __init__(self):
         self.pen = None
         pass
 
+    @property
+    def extents(self):
+        """
+        Finite rectangle enclosing everything this shape draws. Unlike
+        bounding, this is meant for invalidating screen areas, not culling.
+        """
+        return self.bounding
+
     def _intersects(self, bounding:Tuple[int, int, int, int]):
         x0, y0, x1, y1 = bounding
         x2, y2, x3, y3 = self.bounding
         return x2 <= x1 and x0 <= x3 and y2 <= y1 and y0 <= y3
 
+    def _extents_intersect(self, bounding:Tuple[int, int, int, int]):
+        """
+        Like _intersects, but against the extents, for culling elements whose
+        bounding is unbounded, as it is for the ones with text.
+        """
+        x0, y0, x1, y1 = bounding
+        x2, y2, x3, y3 = self.extents
+        return x2 <= x1 and x0 <= x3 and y2 <= y1 and y0 <= y3
+
     def _fully_in(self, bounding:Tuple[int, int, int, int]):
         x0, y0, x1, y1 = bounding
         x2, y2, x3, y3 = self.bounding
@@ -67,7 +152,7 @@ class Shape:
     def select_pen(self, highlight):
         if highlight:
             if not hasattr(self, 'highlight_pen'):
-                self.highlight_pen = self.pen.highlighted()
+                self.highlight_pen = _share_pen(self.pen.highlighted())
             return self.highlight_pen
         else:
             return self.pen
@@ -110,6 +195,15 @@ class Shape:
 class TextShape(Shape):
 
     LEFT, CENTER, RIGHT = -1, 0, 1
+
+    # Level of detail thresholds, as font sizes in device pixels. Smaller text
+    # is drawn as a grey bar, and even smaller text is not drawn at all.
+    LOD_SIZE = 4.0
+    MIN_SIZE = 1.0
+    BAR_COLOR = (0.5, 0.5, 0.5, 0.5)
+
+    __slots__ = ('x', 'y', 'j', 'w', 'text')
+
     def __init__(self, pen: Pen, x, y, j, w, text: str):
         """
         Text drawn using the baseline point (x,y). 
@@ -128,13 +222,16 @@ class TextShape(Shape):
         :param text: actual text 
         """
         Shape.__init__(self)
-        self.pen = pen.copy()
+        self.pen = _share_pen(pen)
         self.x = x
         self.y = y
         self.j = j  # Centering
         self.w = w  # width
-        self.text = text  # text
-        self.statement_id = self._createUniqueId()
+        self.text = sys.intern(text)  # text, shared with the identical ones
+
+    @property
+    def statement_id(self) -> int:
+        return self._createUniqueId()
 
     def _createUniqueId(self) -> int:
         """
@@ -143,64 +240,27 @@ class TextShape(Shape):
         return hash(str(self.x) + str(self.y) + self.text)
 
     def _draw(self, cr, highlight, bounding, color=None):
+        stats = _get_frame_stats()
+        if stats is None:
+            self._draw_text(cr, highlight, bounding, color)
+        else:
+            start = time.perf_counter()
+            self._draw_text(cr, highlight, bounding, color)
+            stats.add('text_time', time.perf_counter() - start)
 
-        try:
-            layout = self.layout
-        except AttributeError:
-            layout = PangoCairo.create_layout(cr)
-
-            # set font options
-            # see http://lists.freedesktop.org/archives/cairo/2007-February/009688.html
-            context = layout.get_context()
-            fo = cairo.FontOptions()
-            fo.set_antialias(cairo.ANTIALIAS_DEFAULT)
-            fo.set_hint_style(cairo.HINT_STYLE_NONE)
-            fo.set_hint_metrics(cairo.HINT_METRICS_OFF)
-            try:
-                PangoCairo.context_set_font_options(context, fo)
-            except TypeError:
-                # XXX: Some broken pangocairo bindings show the error
-                # 'TypeError: font_options must be a cairo.FontOptions or None'
-                pass
-            except KeyError:
-                # cairo.FontOptions is not registered as a foreign
-                # struct in older PyGObject versions.
-                # https://git.gnome.org/browse/pygobject/commit/?id=b21f66d2a399b8c9a36a1758107b7bdff0ec8eaa
-                pass
+    def _draw_text(self, cr, highlight, bounding, color):
+        # bounding leaves the height of text open, so cull it here before
+        # laying it out
+        if bounding is not None and not self._extents_intersect(bounding):
+            return
 
-            # set font
-            font = Pango.FontDescription()
-
-            # https://developer.gnome.org/pango/stable/PangoMarkupFormat.html
-            markup = GObject.markup_escape_text(self.text)
-            if self.pen.bold:
-                markup = '<b>' + markup + '</b>'
-            if self.pen.italic:
-                markup = '<i>' + markup + '</i>'
-            if self.pen.underline:
-                markup = '<span underline="single">' + markup + '</span>'
-            if self.pen.strikethrough:
-                markup = '<s>' + markup + '</s>'
-            if self.pen.superscript:
-                markup = '<sup><small>' + markup + '</small></sup>'
-            if self.pen.subscript:
-                markup = '<sub><small>' + markup + '</small></sub>'
-
-            success, attrs, text, _ = Pango.parse_markup(markup, -1, '\x00')
-            assert success
-            layout.set_attributes(attrs)
-
-            font.set_family(self.pen.fontname)
-            font.set_absolute_size(self.pen.fontsize*Pango.SCALE)
-            layout.set_font_description(font)
-
-            # set text
-            layout.set_text(text, -1)
-
-            # cache it
-            self.layout = layout
-        else:
-            PangoCairo.update_layout(cr, layout)
+        size = self.pen.fontsize * _get_lod_scale(cr)
+        if size < self.LOD_SIZE:
+            if size >= self.MIN_SIZE:
+                self._draw_bar(cr)
+            return
+
+        layout = get_layout_cache().get_layout(cr, self.pen, self.text)
 
         descent = 2  # XXX get descender from font metrics
 
@@ -242,6 +302,16 @@ class TextShape(Shape):
             cr.line_to(x+self.w, self.y)
             cr.stroke()
 
+    def _draw_bar(self, cr):
+        """
+        Stands in for text too small to be legible, without laying it out.
+        """
+        fontsize = self.pen.fontsize
+        x = self.x - 0.5 * (1 + self.j) * self.w
+        cr.rectangle(x, self.y - 0.6*fontsize, self.w, 0.5*fontsize)
+        cr.set_source_rgba(*self.BAR_COLOR)
+        cr.fill()
+
     def search_text(self, regexp) -> bool:
         return regexp.search(self.text) is not None
 
@@ -250,24 +320,84 @@ class TextShape(Shape):
         x, w, j = self.x, self.w, self.j
         return x - 0.5 * (1 + j) * w, -_inf, x + 0.5 * (1 - j) * w, _inf
 
-class PolygonShape(Shape):
+    @property
+    def extents(self):
+        # the layout height is only known once drawn, so be generous
+        x0, _, x1, _ = self.bounding
+        fontsize = self.pen.fontsize
+        return x0, self.y - 1.5*fontsize, x1, self.y + 0.5*fontsize
+
+class PathShape(Shape):
+    """
+    Base class for the shapes drawn from a list of points. The cairo path is
+    built once and then replayed, until the points are replaced.
+    """
+
+    __slots__ = ('_points', '_path', 'filled', 'bounding')
 
     def __init__(self, pen, points, filled=False):
         Shape.__init__(self)
-        self.pen = pen.copy()
+        self.pen = _share_pen(pen)
         self.points = points
         self.filled = filled
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self._path = None
+
+    def _build_path(self, cr):
+        """Traces the path of this shape on cr, by default a polyline through its points"""
+        x0, y0 = self.points[0]
+        cr.move_to(x0, y0)
+        for x1, y1 in self.points[1:]:
+            cr.line_to(x1, y1)
+
+    def _append_path(self, cr):
+        path = self._path
+        if path is None:
+            ctx = _get_path_context()
+            ctx.new_path()
+            self._build_path(ctx)
+            path = self._path = ctx.copy_path()
+            ctx.new_path()
+        cr.append_path(path)
+
+    def _get_paint(self, highlight, color=None):
+        """
+        Returns how _draw paints this shape: whether it is filled, and either
+        the fill color or the (color, line width, dash) of the stroke.
+        """
+        pen = self.select_pen(highlight)
+        if self.filled:
+            return True, pen.fillcolor
+        return False, (pen.color, pen.linewidth, pen.dash)
+
+
+class PolygonShape(PathShape):
+
+    __slots__ = ()
+
+    def __init__(self, pen, points, filled=False):
+        PathShape.__init__(self, pen, points, filled)
+
         x0, y0, x1, y1 = Shape._bounds_from_points(self.points)
         bt = 0 if self.filled else self.pen.linewidth / 2.
         self.bounding = x0 - bt, y0 - bt, x1 + bt, y1 + bt
 
-    def _draw(self, cr, highlight, bounding,color=None):
+    def _build_path(self, cr):
         x0, y0 = self.points[-1]
         cr.move_to(x0, y0)
         for x, y in self.points:
             cr.line_to(x, y)
         cr.close_path()
+
+    def _draw(self, cr, highlight, bounding,color=None):
+        self._append_path(cr)
         pen = self.select_pen(highlight)
         if self.filled:
             cr.set_source_rgba(*pen.fillcolor)
@@ -280,22 +410,19 @@ class PolygonShape(Shape):
             cr.stroke()
 
 
-class LineShape(Shape):
+class LineShape(PathShape):
+
+    __slots__ = ()
 
     def __init__(self, pen, points):
-        Shape.__init__(self)
-        self.pen = pen.copy()
-        self.points = points
+        PathShape.__init__(self, pen, points)
 
         x0, y0, x1, y1 = Shape._bounds_from_points(self.points)
         bt = self.pen.linewidth / 2.
         self.bounding = x0 - bt, y0 - bt, x1 + bt, y1 + bt
 
     def _draw(self, cr, highlight, bounding, color=None):
-        x0, y0 = self.points[0]
-        cr.move_to(x0, y0)
-        for x1, y1 in self.points[1:]:
-            cr.line_to(x1, y1)
+        self._append_path(cr)
         pen = self.select_pen(highlight)
         cr.set_dash(pen.dash)
         cr.set_line_width(pen.linewidth)
@@ -305,14 +432,17 @@ class LineShape(Shape):
             cr.set_source_rgba(*color)
         cr.stroke()
 
+    def _get_paint(self, highlight, color=None):
+        pen = self.select_pen(highlight)
+        return False, (pen.color if color is None else color, pen.linewidth, pen.dash)
+
 
-class BezierShape(Shape):
+class BezierShape(PathShape):
+
+    __slots__ = ()
 
     def __init__(self, pen, points, filled=False):
-        Shape.__init__(self)
-        self.pen = pen.copy()
-        self.points = points
-        self.filled = filled
+        PathShape.__init__(self, pen, points, filled)
 
         x0, y0 = self.points[0]
         xa = xb = x0
@@ -372,12 +502,15 @@ class BezierShape(Shape):
         u = 1 - t
         return p0*(u**3) + 3*t*u*(p1*u + p2*t) + p3*(t**3)
 
-    def _draw(self, cr, highlight, bounding,color=None):
+    def _build_path(self, cr):
         x0, y0 = self.points[0]
         cr.move_to(x0, y0)
         for i in range(1, len(self.points), 3):
             (x1, y1), (x2, y2), (x3, y3) = self.points[i:i+3]
             cr.curve_to(x1, y1, x2, y2, x3, y3)
+
+    def _draw(self, cr, highlight, bounding,color=None):
+        self._append_path(cr)
         pen = self.select_pen(highlight)
         if self.filled:
             cr.set_source_rgba(*pen.fillcolor)
@@ -391,6 +524,8 @@ class BezierShape(Shape):
 
 class Jump(object):
 
+    __slots__ = ('item', 'x', 'y', 'highlight')
+
     def __init__(self, item, x, y, highlight=None):
         self.item = item
         self.x = x
@@ -401,12 +536,21 @@ class Jump(object):
 
 
 class Element(Shape):
-    
+
+    __slots__ = ('shapes', 'bounding', '_extents')
+
     def __init__(self, shapes):
         Shape.__init__(self)
         self.shapes = shapes
+        self._extents = None
         self.bounding = Shape._envelope_bounds(map(_get_bounding, self.shapes))
 
+    @property
+    def extents(self):
+        if self._extents is None:
+            self._extents = Shape._envelope_bounds(map(_get_extents, self.shapes))
+        return self._extents
+
     def _draw(self, cr, highlight, bounding, color=None):
         if bounding is not None and self._fully_in(bounding):
             bounding = None
@@ -429,6 +573,8 @@ class Element(Shape):
 
 class Node(Element):
 
+    __slots__ = ('id', 'x', 'y', 'x1', 'y1', 'x2', 'y2', 'extent', '_statements', '_label')
+
     def __init__(self, id, x, y, w, h, shapes):
         Element.__init__(self, shapes)
 
@@ -440,24 +586,40 @@ class Node(Element):
         self.y1 = y - 0.5*h
         self.x2 = x + 0.5*w
         self.y2 = y + 0.5*h
+        self.extent = max(w, h)
+        # computed on first use, most nodes never need them
+        self._statements = None
+        self._label = None
 
-        # statement ids to TextShape map. Used when removing statements in
-        # conflict mode.
-        self.statements = {}
+    @property
+    def statements(self):
+        """
+        Statement ids to TextShape map. Used when removing statements in
+        conflict mode.
+        """
+        if self._statements is None:
+            statements = {}
+            if self.shapes is not None:
+                for shape in self.shapes:
+                    if isinstance(shape, TextShape):
+                        statements[shape.statement_id] = shape
+            self._statements = statements
+        return self._statements
 
-        if shapes is not None:
-            for shape in shapes:
-                if isinstance(shape, TextShape):
-                    self.statements[shape.statement_id] = shape
+    @property
+    def label(self):
+        if self._label is None:
+            self._label = "\n".join(shape.text for shape in self.statements.values())
+        return self._label
+
+    @property
+    def extents(self):
+        if self._extents is None:
+            self._extents = Shape._envelope_bounds(
+                map(_get_extents, self.shapes),
+                [(self.x1, self.y1, self.x2, self.y2)])
+        return self._extents
 
-        self.label = ""
-        for shape in self.statements.values():
-            self.label += shape.text + "\n"
-        
-        self.label = self.label[:-1]
-        # print("Node: ", self.id, "Label: ", self.label)
-        
-        
     def is_inside(self, x, y):
         return self.x1 <= x and x <= self.x2 and self.y1 <= y and y <= self.y2
        
@@ -470,6 +632,22 @@ class Node(Element):
     def __repr__(self):
         return "<Node %s>" % self.id
 
+    def _draw_box(self, cr, highlight, color=None):
+        """
+        Draws this node as a filled box, for when it is too small on screen
+        to make out its shapes.
+        """
+        if not self.shapes:
+            return
+        if color is None:
+            color = self.shapes[0].select_pen(highlight).color
+        self._append_box_path(cr)
+        cr.set_source_rgba(*color)
+        cr.fill()
+
+    def _append_box_path(self, cr):
+        cr.rectangle(self.x1, self.y1, self.x2 - self.x1, self.y2 - self.y1)
+
     
     def draw(self, cr, highlight, bounding, color=(0.0, 0.0, 1.0, 1.0)):
         if bounding is not None and self._fully_in(bounding):
@@ -486,12 +664,20 @@ def square_distance(x1, y1, x2, y2):
 
 class Edge(Element):
 
+    __slots__ = ('src', 'dst', 'points', 'extent')
+
     def __init__(self, src, dst, points, shapes):
         Element.__init__(self, shapes)
         self.src = src
         self.dst = dst
         self.points = points
 
+        if points:
+            x0, y0, x1, y1 = Shape._bounds_from_points(points)
+            self.extent = max(x1 - x0, y1 - y0)
+        else:
+            self.extent = 0
+
     RADIUS = 10
 
     def is_inside_begin(self, x, y):
@@ -517,10 +703,99 @@ class Edge(Element):
     def __repr__(self):
         return "<Edge %s -> %s>" % (self.src, self.dst)
 
+    def _draw_segment(self, cr, highlight):
+        """
+        Draws this edge as a straight segment between its end points, for
+        when it is too small on screen to make out its curve and arrows.
+        """
+        pen = self.shapes[0].select_pen(highlight)
+        self._append_segment_path(cr)
+        cr.set_dash(())
+        cr.set_line_width(pen.linewidth)
+        cr.set_source_rgba(*pen.color)
+        cr.stroke()
+
+    def _append_segment_path(self, cr):
+        x0, y0 = self.points[0]
+        x1, y1 = self.points[-1]
+        cr.move_to(x0, y0)
+        cr.line_to(x1, y1)
+
+
+class PenBatch:
+    """
+    Collects the shapes of a drawing layer grouped by how they are painted,
+    so each group is filled or stroked with a single cairo call. Fills are
+    drawn first, then strokes and finally text, which matches the order in
+    which xdot emits the shapes of an element. Overlaps between translucent
+    shapes of the same group are painted once instead of twice.
+    """
+
+    def __init__(self):
+        # fill color -> path appenders
+        self.fills = {}
+        # (color, line width, dash) -> path appenders
+        self.strokes = {}
+        self.texts = []
+
+    def add_element(self, element, highlight, bounding, color=None):
+        if bounding is not None and element._fully_in(bounding):
+            bounding = None
+        for shape in element.shapes:
+            if bounding is None or shape._intersects(bounding):
+                self.add_shape(shape, highlight, bounding, color)
+
+    def add_shape(self, shape, highlight, bounding, color=None):
+        if isinstance(shape, PathShape):
+            filled, paint = shape._get_paint(highlight, color)
+            groups = self.fills if filled else self.strokes
+            groups.setdefault(paint, []).append(shape._append_path)
+        else:
+            self.texts.append((shape, highlight, bounding, color))
+
+    def add_box(self, node, highlight, color=None):
+        if not node.shapes:
+            return
+        if color is None:
+            color = node.shapes[0].select_pen(highlight).color
+        self.fills.setdefault(color, []).append(node._append_box_path)
+
+    def add_segment(self, edge, highlight):
+        pen = edge.shapes[0].select_pen(highlight)
+        self.strokes.setdefault((pen.color, pen.linewidth, ()), []).append(edge._append_segment_path)
+
+    def flush(self, cr):
+        """Draws and forgets everything collected so far."""
+        for color, appenders in self.fills.items():
+            for append_path in appenders:
+                append_path(cr)
+            cr.set_source_rgba(*color)
+            cr.fill()
+        for (color, linewidth, dash), appenders in self.strokes.items():
+            for append_path in appenders:
+                append_path(cr)
+            cr.set_dash(dash)
+            cr.set_line_width(linewidth)
+            cr.set_source_rgba(*color)
+            cr.stroke()
+        for shape, highlight, bounding, color in self.texts:
+            shape._draw(cr, highlight, bounding, color)
+        self.fills.clear()
+        self.strokes.clear()
+        del self.texts[:]
+
 
 class Graph(Shape):
 
-    def __init__(self, width=1, height=1, shapes=(), nodes=(), edges=(), outputorder='breadthfirst'):
+    # Level of detail thresholds, as sizes in device pixels. Smaller nodes are
+    # drawn as plain boxes, smaller edges as straight segments, and edges
+    # smaller than EDGE_MIN_SIZE are not drawn at all.
+    NODE_LOD_SIZE = 8.0
+    EDGE_LOD_SIZE = 8.0
+    EDGE_MIN_SIZE = 1.0
+
+    def __init__(self, width=1, height=1, shapes=(), nodes=(), edges=(), outputorder='breadthfirst',
+                 node_by_id=None):
         Shape.__init__(self)
         self.conflictModeOff = True
         self.width = width
@@ -530,6 +805,33 @@ class Graph(Shape):
         self.edges = edges
         self.outputorder = outputorder
         self.conflictingNodes = {}
+        # node to the list of nodes it is in conflict with, see set_conflicting_nodes
+        self.conflictIndex = {}
+        # draw shapes sharing a pen with a single fill/stroke, see PenBatch
+        self.batch_pens = False
+        # node id (bytes) to node, including the nodes without shapes, and
+        # the drawn nodes by their ids that are numbers, as used by the
+        # conflict files and the sidebar
+        if node_by_id is None:
+            node_by_id = {node.id: node for node in nodes}
+        self.node_by_id = node_by_id
+        self.node_by_int = {}
+        for node in nodes:
+            try:
+                self.node_by_int[int(node.id)] = node
+            except ValueError:
+                pass
+
+        # geometry columns of the nodes and edges, built on first use if
+        # NumPy is available, see ElementColumns
+        self.columns = None
+
+        # node to list of the edges starting or ending on it
+        self.incident_edges = {}
+        for edge in self.edges:
+            self.incident_edges.setdefault(edge.src, []).append(edge)
+            if edge.dst is not edge.src:
+                self.incident_edges.setdefault(edge.dst, []).append(edge)
 
         # when in selection mode, we need to highlight the already selected nodes.
         self.selectedNodes = set()
@@ -540,56 +842,159 @@ class Graph(Shape):
             map(_get_bounding, self.edges))
 
     def set_conflicting_nodes(self, nodes):
+        """
+        Sets the conflicts, as a mapping from node id to the ids of the nodes
+        it is in conflict with, such as a mapper.ConflictSet. They are resolved to the nodes of
+        this graph once and for all, ignoring the ids it has no node for.
+        """
         self.conflictingNodes = nodes
+        nodeById = self.node_by_int
+        index = {}
+        for nodeId, conflictIds in nodes.items():
+            node = nodeById.get(nodeId)
+            if node is None:
+                continue
+            conflicting = [nodeById[i] for i in conflictIds if i in nodeById]
+            if conflicting:
+                index[node] = conflicting
+        self.conflictIndex = index
+
+    def snapshot(self):
+        """
+        Returns a copy of this graph which is not affected by later changes
+        to it, so it can be drawn from another thread. Elements are shared.
+        """
+        graph = copy.copy(self)
+        graph.shapes = tuple(self.shapes)
+        graph.nodes = tuple(self.nodes)
+        graph.edges = tuple(self.edges)
+        graph.selectedNodes = frozenset(self.selectedNodes)
+        graph.source = self
+        return graph
 
     def get_size(self):
         return self.width, self.height
 
-    def _draw_shapes(self, cr, bounding):
+    def _draw_shapes(self, cr, bounding, batch=None):
         for shape in self.shapes:
             if bounding is None or shape._intersects(bounding):
-                shape._draw(cr, highlight=False, bounding=bounding)
+                if batch is None:
+                    shape._draw(cr, highlight=False, bounding=bounding)
+                else:
+                    batch.add_shape(shape, False, bounding)
 
-    def _draw_nodes(self, cr, bounding, highlight_items):
+    def _draw_node(self, cr, node, highlight, bounding, scale, color=None, batch=None):
+        if node.extent * scale < self.NODE_LOD_SIZE:
+            if batch is None:
+                node._draw_box(cr, highlight, color)
+            else:
+                batch.add_box(node, highlight, color)
+        elif batch is not None:
+            batch.add_element(node, highlight, bounding, color)
+        elif color is None:
+            node._draw(cr, highlight=highlight, bounding=bounding)
+        else:
+            node.draw(cr, highlight=highlight, bounding=bounding, color=color)
+
+    def _get_columns(self):
+        if self.columns is None and columns.numpy is not None:
+            self.columns = columns.ElementColumns(self.nodes, self.edges)
+        return self.columns
+
+    def _get_visible_nodes(self, bounding):
+        """Returns the nodes intersecting bounding, in drawing order."""
+        if bounding is None:
+            return self.nodes
+        cols = self._get_columns()
+        if cols is None:
+            return [node for node in self.nodes if node._extents_intersect(bounding)]
+        nodes = self.nodes
+        return [nodes[i] for i in cols.visible_nodes(bounding)]
+
+    def _get_visible_edges(self, bounding):
+        """Returns the edges intersecting bounding, in drawing order."""
+        if bounding is None:
+            return self.edges
+        cols = self._get_columns()
+        if cols is None:
+            return [edge for edge in self.edges if edge._extents_intersect(bounding)]
+        edges = self.edges
+        return [edges[i] for i in cols.visible_edges(bounding)]
+
+    def _draw_nodes(self, cr, bounding, highlight_items, scale, batch=None):
         conflictNode = None
+        visible = self._get_visible_nodes(bounding)
 
-        for node in self.nodes:
-            if bounding is None or node._intersects(bounding):
-                highlightOn = node in highlight_items
-                if highlightOn:
-                    if self.conflictModeOff:
-                        conflictNode = node
-                    else:
-                        node._draw(cr, highlight=True, bounding=bounding)
+        for node in visible:
+            highlightOn = node in highlight_items
+            if highlightOn:
+                if self.conflictModeOff:
+                    conflictNode = node
                 else:
-                    if node.id in self.selectedNodes:
-                        node.draw(cr, highlight=False, bounding=bounding, color=(0.0, 0.0, 1.0, 1.0))
-                    else:
-                        node._draw(cr, highlight=False, bounding=bounding)
-                   
-        if conflictNode is not None:
-            self._drawConflictNodes(cr, conflictNode, bounding=bounding)
+                    self._draw_node(cr, node, True, bounding, scale, batch=batch)
+            else:
+                if node.id in self.selectedNodes:
+                    self._draw_node(cr, node, False, bounding, scale, color=(0.0, 0.0, 1.0, 1.0), batch=batch)
+                else:
+                    self._draw_node(cr, node, False, bounding, scale, batch=batch)
 
-    def _drawConflictNodes(self, cr, node, bounding):
-        nodeId = int(node.id.decode("utf-8"))
-        node._draw(cr, highlight=True, bounding=bounding)
-        
-        # only highlight the conflicting nodes if the conflict file is loaded, or has
-        # an entry for nodeId
-        if self.conflictingNodes.get(nodeId) is not None:
-            nodesToHighlightIds =[x for x in self.conflictingNodes[nodeId]]
-            # print("Highlighting these nodes as well: ", nodesToHighlightIds)
-            for n in self.nodes:
-                if int(n.id.decode("utf-8")) in nodesToHighlightIds:
-                    n._draw(cr, highlight=True, bounding=bounding)
-        
+        drawn = len(visible)
+        stats = _get_frame_stats()
+        if stats is not None:
+            stats.add('nodes_drawn', drawn)
+            stats.add('nodes_culled', len(self.nodes) - drawn)
 
-    def _draw_edges(self, cr, bounding, highlight_items):
-        for edge in self.edges:
-            if bounding is None or edge._intersects(bounding):
-                should_highlight = any(e in highlight_items
-                                       for e in (edge, edge.src, edge.dst))
-                edge._draw(cr, highlight=should_highlight, bounding=bounding)
+        if conflictNode is not None:
+            if batch is not None:
+                # conflicting nodes are drawn over their unhighlighted selves
+                batch.flush(cr)
+            self._drawConflictNodes(cr, conflictNode, bounding, scale, batch)
+
+    def _drawConflictNodes(self, cr, node, bounding, scale, batch=None):
+        self._draw_node(cr, node, True, bounding, scale, batch=batch)
+        for n in self.get_conflicting_nodes(node):
+            if bounding is None or n._extents_intersect(bounding):
+                self._draw_node(cr, n, True, bounding, scale, batch=batch)
+
+    def get_conflicting_nodes(self, node):
+        """
+        Returns the nodes in conflict with node. Empty unless the conflict file
+        is loaded and has an entry for node.
+        """
+        return self.conflictIndex.get(node, ())
+
+    def _draw_edge(self, cr, edge, highlight, bounding, scale, batch=None):
+        size = edge.extent * scale
+        if size < self.EDGE_MIN_SIZE:
+            return
+        if size < self.EDGE_LOD_SIZE:
+            if batch is None:
+                edge._draw_segment(cr, highlight)
+            else:
+                batch.add_segment(edge, highlight)
+        elif batch is None:
+            edge._draw(cr, highlight=highlight, bounding=bounding)
+        else:
+            batch.add_element(edge, highlight, bounding)
+
+    def _draw_edges(self, cr, bounding, highlight_items, scale, batch=None):
+        # highlighted edges and the ones incident to highlighted nodes
+        highlighted = set()
+        for item in highlight_items:
+            if isinstance(item, Node):
+                highlighted.update(self._get_incident_edges(item))
+            elif isinstance(item, Edge):
+                highlighted.add(item)
+
+        visible = self._get_visible_edges(bounding)
+        for edge in visible:
+            self._draw_edge(cr, edge, edge in highlighted, bounding, scale, batch)
+
+        drawn = len(visible)
+        stats = _get_frame_stats()
+        if stats is not None:
+            stats.add('edges_drawn', drawn)
+            stats.add('edges_culled', len(self.edges) - drawn)
 
     def draw(self, cr, highlight_items=None, bounding=None):
         if bounding is not None:
@@ -600,20 +1005,109 @@ class Graph(Shape):
 
         if highlight_items is None:
             highlight_items = ()
+        elif not isinstance(highlight_items, (set, frozenset)):
+            highlight_items = set(highlight_items)
+        scale = _get_lod_scale(cr)
         cr.set_source_rgba(0.0, 0.0, 0.0, 1.0)
 
         cr.set_line_cap(cairo.LINE_CAP_BUTT)
         cr.set_line_join(cairo.LINE_JOIN_MITER)
 
-        self._draw_shapes(cr, bounding)
         if self.outputorder == 'edgesfirst':
-            self._draw_edges(cr, bounding, highlight_items)
-            self._draw_nodes(cr, bounding, highlight_items)
+            layers = (('edges_time', self._draw_edges), ('nodes_time', self._draw_nodes))
         else:
-            self._draw_nodes(cr, bounding, highlight_items)
-            self._draw_edges(cr, bounding, highlight_items)
+            layers = (('nodes_time', self._draw_nodes), ('edges_time', self._draw_edges))
+
+        # Batching only reorders shapes within a layer, so that the graph
+        # shapes, nodes and edges still stack as outputorder says.
+        batch = PenBatch() if self.batch_pens else None
+        stats = _get_frame_stats()
+
+        self._draw_shapes(cr, bounding, batch)
+        if batch is not None:
+            batch.flush(cr)
+        for field, draw_layer in layers:
+            if stats is not None:
+                start = time.perf_counter()
+            draw_layer(cr, bounding, highlight_items, scale, batch)
+            if batch is not None:
+                batch.flush(cr)
+            if stats is not None:
+                stats.add(field, time.perf_counter() - start)
+
+    def _get_incident_edges(self, node):
+        return self.incident_edges.get(node, ())
+
+    def _get_highlighted_elements(self, highlight_items):
+        """
+        Returns the nodes and the edges that are drawn highlighted for the
+        given highlight_items, without looking at the rest of the graph.
+        """
+        nodes = []
+        edges = []
+        for item in highlight_items:
+            if isinstance(item, Node):
+                nodes.append(item)
+                if self.conflictModeOff:
+                    nodes.extend(self.get_conflicting_nodes(item))
+                edges.extend(self._get_incident_edges(item))
+            elif isinstance(item, Edge):
+                edges.append(item)
+        return list(dict.fromkeys(nodes)), list(dict.fromkeys(edges))
+
+    def draw_highlight(self, cr, highlight_items, bounding=None):
+        """
+        Draws only the highlighted elements, as an overlay over the graph
+        drawn without highlight_items.
+        """
+        if not highlight_items:
+            return
+        scale = _get_lod_scale(cr)
+        nodes, edges = self._get_highlighted_elements(highlight_items)
+
+        cr.set_line_cap(cairo.LINE_CAP_BUTT)
+        cr.set_line_join(cairo.LINE_JOIN_MITER)
+
+        def draw_nodes():
+            for node in nodes:
+                if bounding is None or node._extents_intersect(bounding):
+                    self._draw_node(cr, node, True, bounding, scale)
+
+        def draw_edges():
+            for edge in edges:
+                if bounding is None or edge._extents_intersect(bounding):
+                    self._draw_edge(cr, edge, True, bounding, scale)
+
+        if self.outputorder == 'edgesfirst':
+            draw_edges()
+            draw_nodes()
+        else:
+            draw_nodes()
+            draw_edges()
+
+    def get_highlight_extents(self, highlight_items):
+        """
+        Returns the rectangle enclosing everything draw_highlight draws for
+        highlight_items, or None if it draws nothing.
+        """
+        if not highlight_items:
+            return None
+        nodes, edges = self._get_highlighted_elements(highlight_items)
+        if not nodes and not edges:
+            return None
+        return Shape._envelope_bounds(map(_get_extents, nodes), map(_get_extents, edges))
 
     def get_element(self, x, y):
+        cols = self._get_columns()
+        if cols is not None:
+            i = cols.node_at(x, y)
+            if i is not None:
+                return self.nodes[i]
+            i = cols.edge_end_at(x, y, Edge.RADIUS)
+            if i is not None:
+                return self.edges[i]
+            return None
+
         for node in self.nodes:
             if node.is_inside(x, y):
                 return node
@@ -623,6 +1117,16 @@ class Graph(Shape):
 
 
     def get_jump(self, x, y):
+        cols = self._get_columns()
+        if cols is not None:
+            i = cols.edge_end_at(x, y, Edge.RADIUS)
+            if i is not None:
+                return self.edges[i].get_jump(x, y)
+            i = cols.node_at(x, y)
+            if i is not None:
+                return self.nodes[i].get_jump(x, y)
+            return None
+
         for edge in self.edges:
             jump = edge.get_jump(x, y)
             if jump is not None:
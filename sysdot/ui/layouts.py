@@ -0,0 +1,129 @@
+import threading
+
+import gi
+gi.require_version('PangoCairo', '1.0')
+
+from gi.repository import GObject
+from gi.repository import Pango
+from gi.repository import PangoCairo
+import cairo
+
+from .cache import LRUCache
+
+
+class LayoutCache:
+    """
+    Pango layouts shared by all the TextShapes that draw the same text with
+    the same font, so identical labels are laid out only once. Layouts that
+    were not drawn for a while are evicted once the memory budget is used up.
+    """
+
+    MAX_BYTES = 32 * 1024 * 1024
+    # rough cost of a layout, on top of the one of its text
+    LAYOUT_BYTES = 1024
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.layouts = LRUCache(max_bytes)
+        self.fonts = {}
+        self.font_options = None
+
+    def get_layout(self, cr, pen, text: str):
+        """
+        Returns a layout for text drawn with pen, updated for cr.
+        """
+        key = (text, pen.fontname, pen.fontsize,
+               pen.bold, pen.italic, pen.underline, pen.strikethrough,
+               pen.superscript, pen.subscript)
+        layout = self.layouts.get(key)
+        if layout is None:
+            layout = self._create_layout(cr, pen, text)
+            self.layouts.put(key, layout, self.LAYOUT_BYTES + 4*len(text))
+        else:
+            PangoCairo.update_layout(cr, layout)
+        return layout
+
+    def stats(self):
+        """Returns the hit/miss counters of this cache, as a dict."""
+        return self.layouts.stats()
+
+    def clear(self):
+        self.layouts.clear()
+
+    def _get_font_options(self):
+        # see http://lists.freedesktop.org/archives/cairo/2007-February/009688.html
+        if self.font_options is None:
+            fo = cairo.FontOptions()
+            fo.set_antialias(cairo.ANTIALIAS_DEFAULT)
+            fo.set_hint_style(cairo.HINT_STYLE_NONE)
+            fo.set_hint_metrics(cairo.HINT_METRICS_OFF)
+            self.font_options = fo
+        return self.font_options
+
+    def _get_font(self, family, size):
+        try:
+            return self.fonts[family, size]
+        except KeyError:
+            font = Pango.FontDescription()
+            font.set_family(family)
+            font.set_absolute_size(size*Pango.SCALE)
+            self.fonts[family, size] = font
+            return font
+
+    def _create_layout(self, cr, pen, text):
+        layout = PangoCairo.create_layout(cr)
+
+        # set font options
+        context = layout.get_context()
+        try:
+            PangoCairo.context_set_font_options(context, self._get_font_options())
+        except TypeError:
+            # XXX: Some broken pangocairo bindings show the error
+            # 'TypeError: font_options must be a cairo.FontOptions or None'
+            pass
+        except KeyError:
+            # cairo.FontOptions is not registered as a foreign
+            # struct in older PyGObject versions.
+            # https://git.gnome.org/browse/pygobject/commit/?id=b21f66d2a399b8c9a36a1758107b7bdff0ec8eaa
+            pass
+
+        # https://developer.gnome.org/pango/stable/PangoMarkupFormat.html
+        markup = GObject.markup_escape_text(text)
+        if pen.bold:
+            markup = '<b>' + markup + '</b>'
+        if pen.italic:
+            markup = '<i>' + markup + '</i>'
+        if pen.underline:
+            markup = '<span underline="single">' + markup + '</span>'
+        if pen.strikethrough:
+            markup = '<s>' + markup + '</s>'
+        if pen.superscript:
+            markup = '<sup><small>' + markup + '</small></sup>'
+        if pen.subscript:
+            markup = '<sub><small>' + markup + '</small></sub>'
+
+        success, attrs, text, _ = Pango.parse_markup(markup, -1, '\x00')
+        assert success
+        layout.set_attributes(attrs)
+
+        # set font
+        layout.set_font_description(self._get_font(pen.fontname, pen.fontsize))
+
+        # set text
+        layout.set_text(text, -1)
+        return layout
+
+
+_local = threading.local()
+
+
+def get_layout_cache() -> LayoutCache:
+    """
+    Returns the layout cache shared by all the TextShapes drawn from the
+    calling thread. Pango layouts must not be used from several threads at
+    once, so each rendering thread gets its own cache.
+    """
+    try:
+        return _local.layout_cache
+    except AttributeError:
+        _local.layout_cache = LayoutCache()
+        return _local.layout_cache
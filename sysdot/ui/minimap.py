@@ -0,0 +1,136 @@
+import gi
+gi.require_version('Gtk', '3.0')
+gi.require_version('PangoCairo', '1.0')
+
+from gi.repository import Gtk
+from gi.repository import Gdk
+
+from . import renderer
+
+
+class MiniMap(Gtk.DrawingArea):
+    """
+    Overview of the whole graph shown by a DotWidget, with the part of it
+    currently in view outlined. Clicking or dragging on it moves the view.
+
+    The graph is rendered into a thumbnail once per graph and size, so
+    following the view only costs redrawing its outline.
+    """
+
+    WIDTH, HEIGHT = 200, 150
+    MARGIN = 4  # pixels around the thumbnail
+
+    def __init__(self, dot_widget):
+        Gtk.DrawingArea.__init__(self)
+        self.dot_widget = dot_widget
+        self.thumbnail = None
+        self.outline = None
+
+        self.set_size_request(self.WIDTH, self.HEIGHT)
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK |
+                        Gdk.EventMask.BUTTON_RELEASE_MASK |
+                        Gdk.EventMask.BUTTON1_MOTION_MASK)
+        self.connect("draw", self.on_draw)
+        self.connect("button-press-event", self.on_button_press)
+        self.connect("button-release-event", self.on_button_release)
+        self.connect("motion-notify-event", self.on_motion_notify)
+        dot_widget.connect("view-changed", self.on_view_changed)
+
+    def get_thumbnail(self):
+        graph = self.dot_widget.graph
+        width = self.get_allocated_width() - 2 * self.MARGIN
+        height = self.get_allocated_height() - 2 * self.MARGIN
+        if width <= 0 or height <= 0 or graph.width <= 0 or graph.height <= 0:
+            return None
+        thumbnail = self.thumbnail
+        if thumbnail is None or thumbnail.graph is not graph or \
+                (thumbnail.viewport.width, thumbnail.viewport.height) != (width, height):
+            # small enough for most shapes to be drawn at their lowest level
+            # of detail
+            zoom_ratio = min(width / graph.width, height / graph.height)
+            viewport = renderer.Viewport(0.5 * graph.width, 0.5 * graph.height,
+                                         zoom_ratio, width, height)
+            thumbnail = self.thumbnail = renderer.render_frame(graph, viewport)
+        return thumbnail
+
+    def graph2minimap(self, x, y):
+        viewport = self.thumbnail.viewport
+        x0, y0 = viewport.get_origin()
+        return (self.MARGIN + (x - x0) * viewport.zoom_ratio,
+                self.MARGIN + (y - y0) * viewport.zoom_ratio)
+
+    def minimap2graph(self, x, y):
+        viewport = self.thumbnail.viewport
+        x0, y0 = viewport.get_origin()
+        return (x0 + (x - self.MARGIN) / viewport.zoom_ratio,
+                y0 + (y - self.MARGIN) / viewport.zoom_ratio)
+
+    def get_outline(self):
+        """Returns the rectangle of the view, in minimap pixels."""
+        x0, y0, x1, y1 = self.dot_widget.get_viewport().get_bounding()
+        x0, y0 = self.graph2minimap(x0, y0)
+        x1, y1 = self.graph2minimap(x1, y1)
+        return x0, y0, x1 - x0, y1 - y0
+
+    def on_draw(self, widget, cr):
+        width, height = self.get_allocated_width(), self.get_allocated_height()
+        cr.set_source_rgb(1.0, 1.0, 1.0)
+        cr.paint()
+
+        thumbnail = self.get_thumbnail()
+        if thumbnail is None:
+            self.outline = None
+            return False
+        cr.set_source_surface(thumbnail.surface, self.MARGIN, self.MARGIN)
+        cr.paint()
+
+        self.outline = self.get_outline()
+        x, y, w, h = self.outline
+        cr.rectangle(x, y, w, h)
+        cr.set_source_rgba(.5, .5, 1.0, 0.25)
+        cr.fill_preserve()
+        cr.set_source_rgba(.5, .5, 1.0, 1.0)
+        cr.set_line_width(1)
+        cr.stroke()
+
+        cr.rectangle(0.5, 0.5, width - 1, height - 1)
+        cr.set_source_rgb(0.5, 0.5, 0.5)
+        cr.stroke()
+        return False
+
+    def _queue_draw_outline(self, outline):
+        x, y, w, h = outline
+        pad = 2  # line width and antialiasing
+        self.queue_draw_area(int(x) - pad, int(y) - pad, int(w) + 2 * pad + 1, int(h) + 2 * pad + 1)
+
+    def on_view_changed(self, dot_widget):
+        thumbnail = self.thumbnail
+        if self.outline is None or thumbnail is None or thumbnail.graph is not dot_widget.graph:
+            self.queue_draw()
+            return
+        # only the old and new outlines need to be redrawn
+        self._queue_draw_outline(self.outline)
+        self._queue_draw_outline(self.get_outline())
+
+    def move_view(self, x, y):
+        if self.thumbnail is None:
+            return
+        self.dot_widget.animation.stop()
+        self.dot_widget.interact()
+        self.dot_widget.set_current_pos(*self.minimap2graph(x, y))
+
+    def on_button_press(self, widget, event):
+        if event.button == 1:
+            self.move_view(event.x, event.y)
+            return True
+        return False
+
+    def on_motion_notify(self, widget, event):
+        self.move_view(event.x, event.y)
+        return True
+
+    def on_button_release(self, widget, event):
+        if event.button == 1:
+            self.dot_widget.end_interaction()
+            return True
+        return False
@@ -0,0 +1,145 @@
+import threading
+from collections import namedtuple
+
+import gi
+gi.require_version('PangoCairo', '1.0')
+
+from gi.repository import GLib
+import cairo
+
+
+class Viewport(namedtuple('Viewport', ('x', 'y', 'zoom_ratio', 'width', 'height'))):
+    """
+    Part of the graph shown in a width x height pixels window, centered on
+    the graph point (x, y).
+    """
+
+    __slots__ = ()
+
+    def get_origin(self):
+        """Returns the graph point shown on the top left pixel."""
+        return (self.x - 0.5 * self.width / self.zoom_ratio,
+                self.y - 0.5 * self.height / self.zoom_ratio)
+
+    def get_bounding(self):
+        x0, y0 = self.get_origin()
+        return (x0, y0,
+                x0 + self.width / self.zoom_ratio,
+                y0 + self.height / self.zoom_ratio)
+
+    def apply(self, cr):
+        """Maps graph coordinates to the pixels of this viewport on cr."""
+        cr.translate(0.5 * self.width, 0.5 * self.height)
+        cr.scale(self.zoom_ratio, self.zoom_ratio)
+        cr.translate(-self.x, -self.y)
+
+
+class Frame:
+    """A viewport of a graph, rendered into an image surface."""
+
+    def __init__(self, graph, viewport: Viewport, surface):
+        self.graph = graph
+        self.viewport = viewport
+        self.surface = surface
+
+    def covers(self, bounding):
+        """Returns whether this frame holds all of bounding, in graph coordinates."""
+        x0, y0, x1, y1 = self.viewport.get_bounding()
+        bx0, by0, bx1, by1 = bounding
+        return x0 <= bx0 and y0 <= by0 and bx1 <= x1 and by1 <= y1
+
+    def paint(self, cr, viewport: Viewport):
+        """
+        Paints this frame on cr as it would be seen from viewport, which may
+        differ from the one it was rendered for. The frame is then moved and
+        scaled accordingly, at the cost of some blurriness.
+        """
+        fx0, fy0 = self.viewport.get_origin()
+        x0, y0 = viewport.get_origin()
+        ratio = viewport.zoom_ratio
+        cr.save()
+        cr.translate((fx0 - x0) * ratio, (fy0 - y0) * ratio)
+        cr.scale(ratio / self.viewport.zoom_ratio, ratio / self.viewport.zoom_ratio)
+        cr.set_source_surface(self.surface, 0, 0)
+        cr.paint()
+        cr.restore()
+
+
+def _create_surface(viewport):
+    return cairo.ImageSurface(cairo.FORMAT_ARGB32,
+                              max(int(viewport.width), 1),
+                              max(int(viewport.height), 1))
+
+
+def render_frame(graph, viewport: Viewport) -> Frame:
+    """Renders the graph, without any highlight, as seen from viewport."""
+    surface = _create_surface(viewport)
+    cr = cairo.Context(surface)
+    viewport.apply(cr)
+    graph.draw(cr, bounding=viewport.get_bounding())
+    surface.flush()
+    return Frame(graph, viewport, surface)
+
+
+def render_tiled_frame(tile_cache, graph, viewport: Viewport) -> Frame:
+    """
+    Same as render_frame, but painting the tiles of tile_cache, so only the
+    missing ones get rendered.
+    """
+    surface = _create_surface(viewport)
+    cr = cairo.Context(surface)
+    x0, y0 = viewport.get_origin()
+    tile_cache.draw(cr, graph, x0, y0, viewport.zoom_ratio, viewport.width, viewport.height)
+    surface.flush()
+    return Frame(graph, viewport, surface)
+
+
+class RenderWorker:
+    """
+    Renders frames on a background thread, and hands them to callback on the
+    main loop. Only the latest request is kept: requests still pending when a
+    new one comes in are dropped.
+
+    The graphs handed over must not change while being rendered, see
+    Graph.snapshot.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._condition = threading.Condition()
+        self._request = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='sysdot-render', daemon=True)
+        self._thread.start()
+
+    def request(self, graph, viewport: Viewport):
+        with self._condition:
+            self._request = (graph, viewport)
+            self._condition.notify()
+
+    def stop(self):
+        """
+        Ends the thread once the frame it may be rendering is done. Frames
+        still to be delivered are dropped.
+        """
+        with self._condition:
+            self._stopped = True
+            self._request = None
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._request is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                graph, viewport = self._request
+                self._request = None
+            frame = render_frame(graph, viewport)
+            GLib.idle_add(self._deliver, frame)
+
+    def _deliver(self, frame):
+        if not self._stopped:
+            self.callback(frame)
+        return False
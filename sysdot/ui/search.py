@@ -0,0 +1,142 @@
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+import gi
+gi.require_version('Gtk', '3.0')
+
+from gi.repository import GLib
+
+from .elements import TextShape
+
+
+class SearchIndex:
+    """
+    Trigram index of the text of the nodes of a graph. A regular expression
+    can only match text containing all the trigrams of the literal parts it
+    requires, so only the nodes having them all are searched.
+
+    Trigrams are lower cased, so the candidates also suit case insensitive
+    searches.
+    """
+
+    def __init__(self, graph):
+        self.graph = graph
+        self.nodes = graph.nodes
+        # trigram -> indices of the nodes having it, in increasing order
+        self.postings = {}
+        for i, node in enumerate(self.nodes):
+            for shape in node.shapes:
+                if isinstance(shape, TextShape):
+                    self._add(i, shape.text.lower())
+
+    def _add(self, i, text):
+        postings = self.postings
+        for j in range(len(text) - 2):
+            posting = postings.setdefault(text[j:j + 3], [])
+            if not posting or posting[-1] != i:
+                posting.append(i)
+
+    @staticmethod
+    def required_literals(regexp):
+        """
+        Returns the literal strings any match of regexp contains: the runs of
+        plain characters of its top level. Alternations, groups and
+        repetitions are skipped over, which only widens the search.
+        """
+        try:
+            items = sre_parse.parse(regexp.pattern, regexp.flags)
+        except (re.error, TypeError):
+            return []
+        literals = []
+        run = []
+        for op, av in items:
+            if op is sre_parse.LITERAL:
+                run.append(chr(av))
+            else:
+                if run:
+                    literals.append(''.join(run))
+                run = []
+        if run:
+            literals.append(''.join(run))
+        return literals
+
+    def candidates(self, regexp):
+        """
+        Returns the nodes that may contain a match of regexp, in graph order.
+        """
+        trigrams = set()
+        for literal in self.required_literals(regexp):
+            literal = literal.lower()
+            trigrams.update(literal[j:j + 3] for j in range(len(literal) - 2))
+        if not trigrams:
+            return self.nodes
+
+        postings = sorted((self.postings.get(trigram, ()) for trigram in trigrams), key=len)
+        indices = postings[0]
+        for posting in postings[1:]:
+            if not indices:
+                break
+            posting = set(posting)
+            indices = [i for i in indices if i in posting]
+        return [self.nodes[i] for i in indices]
+
+    def search(self, regexp, chunk_size=None):
+        """
+        Returns the nodes matching regexp, or, given chunk_size, yields them
+        as lists, checking chunk_size candidates at a time.
+        """
+        candidates = self.candidates(regexp)
+        if chunk_size is None:
+            return [node for node in candidates if node.search_text(regexp)]
+        return self._search_chunks(regexp, candidates, chunk_size)
+
+    @staticmethod
+    def _search_chunks(regexp, candidates, chunk_size):
+        for start in range(0, len(candidates), chunk_size):
+            yield [node for node in candidates[start:start + chunk_size]
+                   if node.search_text(regexp)]
+
+
+class IncrementalSearch:
+    """
+    Searches on the main loop, a chunk of candidates at a time, once no new
+    query came for DELAY milliseconds. callback is given the nodes newly
+    found in each chunk, and whether the search is over. Starting a new
+    search cancels the current one.
+    """
+
+    DELAY = 150
+    CHUNK_SIZE = 2000
+
+    def __init__(self, callback):
+        self.callback = callback
+        self.source_id = None
+
+    def start(self, index, regexp):
+        self.cancel()
+        self.source_id = GLib.timeout_add(self.DELAY, self._begin, index, regexp)
+
+    def cancel(self):
+        if self.source_id is not None:
+            GLib.source_remove(self.source_id)
+            self.source_id = None
+
+    def _begin(self, index, regexp):
+        chunks = index.search(regexp, self.CHUNK_SIZE)
+        self.source_id = GLib.idle_add(self._step, chunks)
+        return False
+
+    def _step(self, chunks):
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            self.source_id = None
+            self.callback([], True)
+            return False
+        if chunk:
+            self.callback(chunk, False)
+        return True
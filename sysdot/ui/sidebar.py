@@ -6,6 +6,129 @@ from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gtk
 from gi.repository import Gdk
+
+
+class AdjacencyModel(GObject.Object, Gtk.TreeModel):
+    """
+    Read only tree of node ids: the top level rows are roots, and the
+    children of a row are the nodes adjacent to its node. Nothing is kept
+    per top level row, and the rows below are only made when the view asks
+    for them, as they are expanded and scrolled to.
+
+    If depth is given, only that many levels of rows are shown.
+    """
+
+    TEXT_COL = 0
+    ID_COL = 1
+
+    def __init__(self, roots=(), adjacency=None, get_text=str, depth=None):
+        GObject.Object.__init__(self)
+        self.roots = roots
+        self.adjacency = adjacency if adjacency is not None else {}
+        self.get_text = get_text
+        self.depth = depth
+        # The row of an iter is its user_data, a key. 0 is the invisible
+        # root, the top level row i has the key i + 1, and the rows below
+        # have the keys following them, indexing rows.
+        # [(parent key, index, node id, depth)]
+        self.rows = []
+        # (parent key, index) -> key, for the rows below the top level
+        self.keys = {}
+
+    def _row(self, key):
+        # (parent key, index, node id, depth) of the row of key
+        n = len(self.roots)
+        if key <= n:
+            return (0, key - 1, self.roots[key - 1], 1)
+        return self.rows[key - n - 1]
+
+    def _children(self, key):
+        if key == 0:
+            return self.roots
+        parent, index, nodeId, depth = self._row(key)
+        if self.depth is not None and depth >= self.depth:
+            return ()
+        return self.adjacency.get(nodeId, ())
+
+    def _nth_child(self, parent, n):
+        children = self._children(parent)
+        if not 0 <= n < len(children):
+            return (False, None)
+        if parent == 0:
+            key = n + 1
+        else:
+            key = self.keys.get((parent, n))
+            if key is None:
+                key = len(self.roots) + len(self.rows) + 1
+                self.rows.append((parent, n, children[n], self._row(parent)[3] + 1))
+                self.keys[(parent, n)] = key
+        treeIter = Gtk.TreeIter()
+        treeIter.user_data = key
+        return (True, treeIter)
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.ITERS_PERSIST
+
+    def do_get_n_columns(self):
+        return 2
+
+    def do_get_column_type(self, column):
+        return (GObject.TYPE_STRING, GObject.TYPE_INT)[column]
+
+    def do_get_iter(self, path):
+        key = 0
+        treeIter = None
+        for n in path.get_indices():
+            found, treeIter = self._nth_child(key, n)
+            if not found:
+                return (False, None)
+            key = treeIter.user_data
+        return (treeIter is not None, treeIter)
+
+    def do_get_path(self, treeIter):
+        indices = []
+        key = treeIter.user_data
+        while key:
+            parent, index, nodeId, depth = self._row(key)
+            indices.append(index)
+            key = parent
+        return Gtk.TreePath.new_from_indices(indices[::-1])
+
+    def do_get_value(self, treeIter, column):
+        nodeId = self._row(treeIter.user_data)[2]
+        if column == self.TEXT_COL:
+            return self.get_text(nodeId)
+        return nodeId
+
+    def do_iter_next(self, treeIter):
+        parent, index, nodeId, depth = self._row(treeIter.user_data)
+        return self._nth_child(parent, index + 1)
+
+    def do_iter_previous(self, treeIter):
+        parent, index, nodeId, depth = self._row(treeIter.user_data)
+        return self._nth_child(parent, index - 1)
+
+    def do_iter_children(self, parent):
+        return self._nth_child(parent.user_data if parent is not None else 0, 0)
+
+    def do_iter_has_child(self, treeIter):
+        return len(self._children(treeIter.user_data)) > 0
+
+    def do_iter_n_children(self, treeIter):
+        return len(self._children(treeIter.user_data if treeIter is not None else 0))
+
+    def do_iter_nth_child(self, parent, n):
+        return self._nth_child(parent.user_data if parent is not None else 0, n)
+
+    def do_iter_parent(self, child):
+        parent = self._row(child.user_data)[0]
+        if not parent:
+            return (False, None)
+        treeIter = Gtk.TreeIter()
+        treeIter.user_data = parent
+        return (True, treeIter)
+
+
 class SideBar(Gtk.Revealer):
     __gsignals__ = {
 
@@ -24,8 +147,14 @@ class SideBar(Gtk.Revealer):
 
         ## set in treeModelSetup
         self.store = None
-        # self.nodes is dict from node.id (int) to node
+        # self.nodes is dict from node.id (int) to its label, filled in as
+        # the rows are shown, see getLabel
         self.nodes = nodes if nodes is not None else {}
+        # the graph listed, see set_nodes_and_edges
+        self.graph = None
+        # top level row of each node id, the same in both tabs as their
+        # models never change
+        self.nodeRows = {}
 
         # self.childNodes is dict from nodeId to list of nodeId
         # {int: list(int)}
@@ -91,89 +220,78 @@ class SideBar(Gtk.Revealer):
         """
         notebook = self.get_child()
         treeview = notebook.get_nth_page(notebook.get_current_page()).get_child()
-        store = treeview.get_model()
-        nodeIter = store.get_iter_first()
-        while nodeIter is not False and nodeIter is not None:
-            curNodeId = store.get(nodeIter, self.ID_COL)[0]
-            if (curNodeId == nodeId):
-                treeview.get_selection().select_iter(nodeIter)
-                path = store.get_path(nodeIter)
-                treeview.scroll_to_cell(path=path)
-                break
-
-            nextNodeIter = store.iter_next(nodeIter)
-            nodeIter = nextNodeIter
+        row = self.nodeRows.get(nodeId)
+        if row is None:
+            return
+        path = Gtk.TreePath.new_from_indices([row])
+        treeview.get_selection().select_path(path)
+        treeview.scroll_to_cell(path=path)
+
+    def getLabel(self, nodeId):
+        """Returns the first line of the label of a node, computed on first use."""
+        label = self.nodes.get(nodeId)
+        if label is None:
+            label = self.graph.node_by_int[nodeId].label
+            label = label[:label.index('\n')]
+            self.nodes[nodeId] = label
+        return label
 
     def set_nodes_and_edges(self, graph):
         nodes = graph.nodes
         childEdges = graph.edges
-        # reset both the stores
-        self.childTreeview.get_model().clear()
-        self.conflictTreeview.get_model().clear()
-
 
+        self.graph = graph
         self.nodes.clear()
         self.childNodes.clear()
+        # nodes without shapes, such as subgraphs, and the ones whose ids are
+        # not numbers are not listed
+        nodeIds = {}
+        nodeList = []
         for node in nodes:
-            label = node.label[:node.label.index('\n')]
-            self.nodes[int(node.id)] = label
-
-        conflictEdges =  dict(filter(lambda el: el[0] in self.nodes, graph.conflictingNodes.items()))
+            try:
+                nodeId = int(node.id)
+            except ValueError:
+                continue
+            nodeIds[node] = nodeId
+            nodeList.append(nodeId)
+        self.nodeRows = {nodeId: row for row, nodeId in enumerate(nodeList)}
+
+        conflictEdges = {}
+        for node, conflicting in graph.conflictIndex.items():
+            if node in nodeIds:
+                conflictEdges[nodeIds[node]] = [nodeIds[n] for n in conflicting
+                                                 if n in nodeIds]
 
         for edge in childEdges:
-            (srcId, dstId) = int(edge.src.id), int(edge.dst.id)
+            if edge.src not in nodeIds or edge.dst not in nodeIds:
+                continue
+            (srcId, dstId) = nodeIds[edge.src], nodeIds[edge.dst]
             srcList = []
             if srcId not in self.childNodes:
                 self.childNodes[srcId] = []
             srcList = self.childNodes[srcId]
             srcList.append(dstId)
-        
-        self.populateTreeModel(edges=self.childNodes, treeview=self.childTreeview)
-        self.populateTreeModel(edges=conflictEdges, treeview=self.conflictTreeview)
+
+        # Rows are made as they are shown. Adjacent nodes can be expanded
+        # level after level, conflicts only show their own conflicts.
+        self.treeModelSetup(self.childTreeview, edges=self.childNodes, roots=nodeList)
+        self.treeModelSetup(self.conflictTreeview, edges=conflictEdges, roots=nodeList, depth=2)
 
     def treeViewSetup(self, treeview):
         renderer = Gtk.CellRendererText.new()
         column = Gtk.TreeViewColumn("Nodes", renderer, text=self.TEXT_COL)
+        # All rows have the same height, so the view only asks the model for
+        # the ones it shows, rather than measuring every one of them.
+        column.set_sizing(Gtk.TreeViewColumnSizing.FIXED)
+        column.set_expand(True)
         treeview.append_column(column)
+        treeview.set_fixed_height_mode(True)
 
-    def treeModelSetup(self, treeview, edges):
+    def treeModelSetup(self, treeview, edges, roots=(), depth=None):
         # first column is display text, last is the node id
-        store = Gtk.TreeStore(GObject.TYPE_STRING, GObject.TYPE_INT)
+        store = AdjacencyModel(roots, edges, self.getLabel, depth)
         treeview.set_model(store)
-        # self.populateTreeModel(edges=edges, treeview=treeview)
-
-    def populateTreeModel(self, edges, treeview, rootIter=None):
 
-        ## simple closure to set a node
-        def setNode(nodeId, pos):
-            store.set(pos, self.TEXT_COL, self.nodes[nodeId]) # set the text
-            store.set(pos, self.ID_COL, nodeId) # set id
-
-        store = treeview.get_model()
-        nodeList = []
-        if rootIter is None:
-            nodeList = self.nodes.keys()
-        else:
-            nodeId = store.get(rootIter, self.ID_COL)[0]
-            nodeList = edges[nodeId]
-    
-        if rootIter is not None and store.iter_has_child(rootIter):
-            childIter = store.iter_children(rootIter)
-            while childIter is not False and childIter is not None:
-                nextChildIter = store.iter_next(childIter)
-                store.remove(childIter)
-                childIter = nextChildIter
-
-        for node in nodeList:
-            pos = store.append(rootIter)
-
-            setNode(node, pos)
-            # append children as well
-            if node in edges:
-                for child in edges[node]:
-                    pos2 = store.append(pos)
-                    setNode(child, pos2)
-    
     def on_row_activated(self, treeview, node, column):
         # Signal the dotwidget
         store = treeview.get_model() 
@@ -185,7 +303,6 @@ class SideBar(Gtk.Revealer):
             if pos is None:
             # Don't know how this should be possible
                 return
-            
-            edges = self.childNodes
-            self.populateTreeModel(edges=edges, treeview=treeview, rootIter=pos)
+
+            treeview.expand_row(node, False)
 
@@ -0,0 +1,99 @@
+import csv
+import json
+import time
+from collections import deque
+
+
+class FrameStats:
+    """
+    Rendering statistics, recorded frame by frame while instrumentation is on.
+
+    Times are in seconds. Node times include the text of the nodes, which is
+    also accounted for separately in text_time.
+    """
+
+    FIELDS = ('frame', 'draw_time',
+              'nodes_time', 'edges_time', 'text_time',
+              'nodes_drawn', 'nodes_culled', 'edges_drawn', 'edges_culled',
+              'layouts_created')
+
+    MAX_FRAMES = 100000
+    # number of frames the overlay averages the draw time over
+    AVERAGE_FRAMES = 60
+
+    def __init__(self):
+        self.frames = deque(maxlen=self.MAX_FRAMES)
+        self.count = 0
+        self.current = None
+        self.started = None
+        # (x, y, width, height) of the overlay last drawn, if any
+        self.overlay_rect = None
+
+    def begin_frame(self):
+        self.current = dict.fromkeys(self.FIELDS, 0)
+        self.current['frame'] = self.count
+        self.started = time.perf_counter()
+
+    def end_frame(self):
+        self.current['draw_time'] = time.perf_counter() - self.started
+        self.frames.append(self.current)
+        self.count += 1
+        self.current = None
+
+    def add(self, field, value):
+        """Adds value to a field of the frame being drawn, if any."""
+        if self.current is not None:
+            self.current[field] += value
+
+    def dump(self, fileName: str):
+        """
+        Writes the recorded frames to fileName, as JSON if its extension is
+        .json, as CSV otherwise.
+        """
+        with open(fileName, 'w', newline='') as f:
+            if fileName.endswith('.json'):
+                json.dump(list(self.frames), f, indent=1)
+            else:
+                writer = csv.DictWriter(f, fieldnames=self.FIELDS)
+                writer.writeheader()
+                writer.writerows(self.frames)
+
+    def overlay_covers(self, extents):
+        """Returns whether extents (x0, y0, x1, y1) lie within the overlay."""
+        if self.overlay_rect is None:
+            return False
+        x, y, w, h = self.overlay_rect
+        x0, y0, x1, y1 = extents
+        return x <= x0 and y <= y0 and x1 <= x + w + 1 and y1 <= y + h + 1
+
+    def draw_overlay(self, cr):
+        """
+        Shows the statistics of the last frame in the top left corner, and
+        returns the rectangle they cover.
+        """
+        if not self.frames:
+            return 0, 0, 0, 0
+        last = self.frames[-1]
+        recent = list(self.frames)[-self.AVERAGE_FRAMES:]
+        average = sum(frame['draw_time'] for frame in recent) / len(recent)
+        lines = [
+            'frame %d: %.1f ms (average %.1f ms)' % (last['frame'], last['draw_time']*1e3, average*1e3),
+            'nodes: %d drawn, %d culled, %.1f ms' % (last['nodes_drawn'], last['nodes_culled'], last['nodes_time']*1e3),
+            'edges: %d drawn, %d culled, %.1f ms' % (last['edges_drawn'], last['edges_culled'], last['edges_time']*1e3),
+            'text: %.1f ms, %d layouts created' % (last['text_time']*1e3, last['layouts_created']),
+        ]
+
+        size = 12
+        cr.save()
+        cr.select_font_face('monospace')
+        cr.set_font_size(size)
+        width = max(cr.text_extents(line)[4] for line in lines)
+        self.overlay_rect = 0, 0, width + size, (len(lines) + 0.5) * size * 1.25
+        cr.rectangle(*self.overlay_rect)
+        cr.set_source_rgba(0.0, 0.0, 0.0, 0.6)
+        cr.fill()
+        cr.set_source_rgba(1.0, 1.0, 1.0, 1.0)
+        for i, line in enumerate(lines):
+            cr.move_to(0.5 * size, (i + 1) * size * 1.25)
+            cr.show_text(line)
+        cr.restore()
@@ -0,0 +1,99 @@
+import math
+
+import cairo
+
+from .cache import LRUCache
+
+
+class TileCache:
+    """
+    Keeps the rendered graph as square offscreen tiles.
+
+    Tiles are rendered at quantized zoom levels and keyed by their level and
+    position in the tile grid, so panning only renders the newly exposed tiles
+    and zooming in between two levels just rescales the cached ones.
+    """
+
+    TILE_SIZE = 256  # pixels
+    ZOOM_BASE = 2 ** 0.25  # zoom ratio between two consecutive levels
+    MAX_BYTES = 64 * 1024 * 1024
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.tiles = LRUCache(max_bytes)
+        self.graph = None
+
+    def invalidate(self):
+        """Drops every cached tile."""
+        self.tiles.clear()
+
+    def quantize(self, zoom_ratio):
+        """
+        Returns the zoom level closest to zoom_ratio, and its zoom ratio.
+        """
+        level = int(round(math.log(zoom_ratio, self.ZOOM_BASE)))
+        return level, self.ZOOM_BASE ** level
+
+    def draw(self, cr, graph, x0, y0, zoom_ratio, width, height, cached_only=False):
+        """
+        Paints the graph, without any highlight, on the (untransformed) cairo
+        context cr, so that the graph point (x0, y0) ends up on the device
+        origin, scaled by zoom_ratio. Only the tiles overlapping both the
+        width x height device rectangle and the clip of cr are painted, and
+        only the missing ones are rendered, unless cached_only is true, in
+        which case they are left out.
+        """
+        if graph is not self.graph:
+            self.invalidate()
+            self.graph = graph
+
+        level, zoom = self.quantize(zoom_ratio)
+        size = self.TILE_SIZE
+        span = size / zoom  # tile size in graph units
+
+        # visible part of the graph
+        cx0, cy0, cx1, cy1 = cr.clip_extents()
+        gx0 = x0 + max(0, cx0) / zoom_ratio
+        gy0 = y0 + max(0, cy0) / zoom_ratio
+        gx1 = x0 + min(width, cx1) / zoom_ratio
+        gy1 = y0 + min(height, cy1) / zoom_ratio
+        if gx1 <= gx0 or gy1 <= gy0:
+            return
+
+        target = cr.get_target()
+        for ty in range(math.floor(gy0 / span), math.floor(gy1 / span) + 1):
+            # Rounding the tile borders to device pixels makes neighbouring
+            # tiles share their edges, so no seams show up in between.
+            dy0 = round((ty * span - y0) * zoom_ratio)
+            dy1 = round(((ty + 1) * span - y0) * zoom_ratio)
+            for tx in range(math.floor(gx0 / span), math.floor(gx1 / span) + 1):
+                dx0 = round((tx * span - x0) * zoom_ratio)
+                dx1 = round(((tx + 1) * span - x0) * zoom_ratio)
+                if dx1 == dx0 or dy1 == dy0:
+                    continue
+
+                key = (level, tx, ty)
+                surface = self.tiles.get(key)
+                if surface is None:
+                    if cached_only:
+                        continue
+                    surface = self._render_tile(target, graph, zoom, span, tx, ty)
+                    self.tiles.put(key, surface, size * size * 4)
+
+                cr.save()
+                cr.translate(dx0, dy0)
+                cr.scale((dx1 - dx0) / size, (dy1 - dy0) / size)
+                cr.set_source_surface(surface, 0, 0)
+                cr.get_source().set_extend(cairo.EXTEND_PAD)
+                cr.rectangle(0, 0, size, size)
+                cr.fill()
+                cr.restore()
+
+    def _render_tile(self, target, graph, zoom, span, tx, ty):
+        size = self.TILE_SIZE
+        surface = target.create_similar(cairo.CONTENT_COLOR_ALPHA, size, size)
+        cr = cairo.Context(surface)
+        gx, gy = tx * span, ty * span
+        cr.scale(zoom, zoom)
+        cr.translate(-gx, -gy)
+        graph.draw(cr, bounding=(gx, gy, gx + span, gy + span))
+        return surface
@@ -48,6 +48,8 @@ from .elements import Node
 
 from .sidebar import SideBar
 from .dotwidget import DotWidget
+from .minimap import MiniMap
+from .search import SearchIndex, IncrementalSearch
 
 from ..conflicts import mapper
 from ..conflicts import dotCreater 
@@ -82,6 +84,19 @@ class DotWindow(Gtk.ApplicationWindow):
         self.sidebar = SideBar(widget=self.dotwidget)
         self.dotwidget.sidebar = self.sidebar
 
+        # Text search, see find_text
+        self.search_index = None
+        self.search = IncrementalSearch(self.on_search_results)
+
+        # Overview of the graph, in the bottom right corner of the graph
+        self.minimap = MiniMap(self.dotwidget)
+        self.minimap.set_halign(Gtk.Align.END)
+        self.minimap.set_valign(Gtk.Align.END)
+        self.minimap.set_margin_end(8)
+        self.minimap.set_margin_bottom(8)
+        overlay = Gtk.Overlay()
+        overlay.add(self.dotwidget)
+        overlay.add_overlay(self.minimap)
 
         box = Gtk.VBox()
         box.set_homogeneous(False) # Allows toolbars to be of different sizes
@@ -93,7 +108,7 @@ class DotWindow(Gtk.ApplicationWindow):
         # Container for sidebar
         pane = Gtk.HPaned(wide_handle=True) # makes for a better separator
         pane.pack1(self.sidebar, False, True)
-        pane.pack2(self.dotwidget, True, False)
+        pane.pack2(overlay, True, False)
         box.add(pane)
 
         self.add(box)
@@ -123,12 +138,13 @@ class DotWindow(Gtk.ApplicationWindow):
 
         # Look at https://developer.gnome.org/icon-naming-spec/ for different icon names
         addButton("applications-accessories", self.hideSidebar, tooltipText="Toggle sidebar")
+        addButton("find-location", self.toggleMinimap, tooltipText="Toggle overview")
         addSeparator()
 
         # File operations
         addButton("document-open", self.on_open, tooltipText="Load a new grph (.dot file)")
         addButton('view-refresh', self.on_reload, "Reloads the graph"),
-        addButton("document-print", self.dotwidget.on_print, "Prints the currently visible part of the graph")
+        addButton("document-print", self.dotwidget.on_print, "Prints the visible part of the graph, or all of it over several pages")
         addSeparator()
 
         # Zoom buttons
@@ -150,14 +166,13 @@ class DotWindow(Gtk.ApplicationWindow):
         header.pack_start(conflictButton)
 
         # Add Find text search
-        # find_toolitem = Gtk.ToolItem()
-        # self.textentry = Gtk.Entry(max_length=20)
-        # self.textentry.set_icon_from_stock(0, Gtk.STOCK_FIND)
-        # find_toolitem.add(self.textentry)
-        # self.textentry.set_activates_default(True)
-        # self.textentry.connect("activate", self.textentry_activate, self.textentry)
-        # self.textentry.connect("changed", self.textentry_changed, self.textentry)
-        # header.pack_start(find_toolitem)
+        find_toolitem = Gtk.ToolItem()
+        self.textentry = Gtk.SearchEntry()
+        self.textentry.set_tooltip_text("Find nodes by their text (regular expression)")
+        find_toolitem.add(self.textentry)
+        self.textentry.connect("activate", self.textentry_activate, self.textentry)
+        self.textentry.connect("changed", self.textentry_changed, self.textentry)
+        header.pack_start(find_toolitem)
 
         # show the standard 3 mnimize, maximize and close buttons
         # header.set_show_close_button(True)
@@ -167,33 +182,54 @@ class DotWindow(Gtk.ApplicationWindow):
     def hideSidebar(self, widget):
         self.sidebar.toggleVisibility()
 
+    def toggleMinimap(self, widget):
+        self.minimap.set_visible(not self.minimap.get_visible())
+
+    def get_search_index(self):
+        """Returns the search index of the graph shown, built on first use."""
+        graph = self.dotwidget.graph
+        if self.search_index is None or self.search_index.graph is not graph:
+            self.search_index = SearchIndex(graph)
+        return self.search_index
+
     def find_text(self, entry_text):
-        found_items = []
-        dot_widget = self.dotwidget
         regexp = re.compile(entry_text)
-        for element in dot_widget.graph.nodes:
-            if element.search_text(regexp):
-                found_items.append(element)
-        return found_items
+        return self.get_search_index().search(regexp)
+
+    def on_search_results(self, found_items, done):
+        # only the new results are added and redrawn
+        self.dotwidget.add_highlight(found_items, search=True)
 
     def textentry_changed(self, widget, entry):
         entry_text = entry.get_text()
         dot_widget = self.dotwidget
+        self.search.cancel()
         if not entry_text:
             dot_widget.set_highlight(None, search=True)
             return
 
-        found_items = self.find_text(entry_text)
-        dot_widget.set_highlight(found_items, search=True)
+        try:
+            regexp = re.compile(entry_text)
+        except re.error:
+            # most likely still being typed
+            return
+        # Results show up as they are found, and typing on cancels the search.
+        dot_widget.set_highlight([], search=True)
+        self.search.start(self.get_search_index(), regexp)
 
     def textentry_activate(self, widget, entry):
         entry_text = entry.get_text()
         dot_widget = self.dotwidget
+        self.search.cancel()
         if not entry_text:
             dot_widget.set_highlight(None, search=True)
             return
 
-        found_items = self.find_text(entry_text)
+        try:
+            found_items = self.find_text(entry_text)
+        except re.error as ex:
+            self.error_dialog(str(ex))
+            return
         dot_widget.set_highlight(found_items, search=True)
         if(len(found_items) == 1):
             dot_widget.animate_to(found_items[0].x, found_items[0].y)
@@ -205,6 +241,7 @@ class DotWindow(Gtk.ApplicationWindow):
         if self.dotwidget.set_dotcode(dotcode, filename):
             self.update_title(filename)
             self.dotwidget.zoom_to_fit()
+            self.search_index = SearchIndex(self.dotwidget.graph)
         
         self.sidebar.set_nodes_and_edges(self.dotwidget.graph)
 
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from array import array
+
+from sysdot.conflicts import mapper
+
+
+CONFLICTS_HTML = '''<html><body>
+<table class="tg">
+<tr>
+  <td class="tg-red2" title="(1,0) (2,1)"><pre>a = b &amp;&amp; c;</pre><pre>x<b>y</b></pre></td>
+  <td class="tg-red2" title="(1,0) (2,0)"><pre>duplicate</pre></td>
+  <td class="tg-red2" title="(1,0) (3,1)"><pre>q = 1;</pre></td>
+</tr>
+<tr>
+  <td class="tg-red2" title="(3,0) (3,1)"><pre>same node</pre></td>
+  <td class="tg-red" title="(4,0) (6,1)"><pre>other class</pre></td>
+  <td class="tg-red2 tg-wide" title="(4,0) (7,1)"><pre>two classes</pre></td>
+  <td class=" tg-red2 " title="(4,0) (5,1)"><pre>
+first line
+second line</pre></td>
+  <td class="tg-red2"><pre>no title</pre></td>
+</tr>
+<tr>
+  <td class="tg-red2" title="(12,0) (1,1)"><pre>if (a &lt; b)</pre></td>
+</tr>
+</table>
+</body></html>
+'''
+
+# what the BeautifulSoup based loader made of CONFLICTS_HTML
+EXPECTED_MAP = {1: [2, 3], 4: [5], 12: [1]}
+EXPECTED_STATEMENTS = {
+    (1, 2): ['a = b && c;', 'x'],
+    (1, 3): ['q = 1;'],
+    (4, 5): ['\nfirst line\nsecond line'],
+    (12, 1): ['if (a < b)'],
+}
+
+
+class ConflictLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        fd, self.fileName = tempfile.mkstemp(suffix='.html')
+        with os.fdopen(fd, 'w') as f:
+            f.write(CONFLICTS_HTML)
+        self.chunkSize = mapper.CHUNK_SIZE
+
+    def tearDown(self):
+        mapper.CHUNK_SIZE = self.chunkSize
+        os.remove(self.fileName)
+
+    def fullMap(self):
+        result = mapper.generateFullMap(self.fileName)
+        return {(key, node.nodeId): node.statements
+                for key, nodes in result.items() for node in nodes}
+
+    def test_generate_map(self):
+        result = mapper.generateMap(self.fileName)
+        self.assertEqual({key: list(value) for key, value in result.items()}, EXPECTED_MAP)
+
+    def test_generate_full_map(self):
+        self.assertEqual(self.fullMap(), EXPECTED_STATEMENTS)
+
+    def test_first_cell_wins_in_full_map(self):
+        # the statements of the duplicate (1, 2) cell are not kept
+        self.assertNotIn(['duplicate'], self.fullMap().values())
+
+    def test_chunk_boundaries(self):
+        # cells, entities and statements split across chunks in every way
+        for size in range(1, 40):
+            mapper.CHUNK_SIZE = size
+            self.assertEqual(self.fullMap(), EXPECTED_STATEMENTS, size)
+            result = mapper.generateMap(self.fileName)
+            self.assertEqual({key: list(value) for key, value in result.items()}, EXPECTED_MAP, size)
+
+
+class ConflictSetTest(unittest.TestCase):
+
+    PAIRS = [(5, 9), (5, 2), (1000000007, 5), (5, 9), (2, 5), (5, 2), (2, 1000000007)]
+
+    def setUp(self):
+        keys = array(mapper.ConflictSet.TYPECODE, [key for key, value in self.PAIRS])
+        values = array(mapper.ConflictSet.TYPECODE, [value for key, value in self.PAIRS])
+        self.conflicts = mapper.ConflictSet.fromPairs(keys, values)
+
+    def test_degree(self):
+        self.assertEqual(self.conflicts.degree(5), 2)
+        self.assertEqual(self.conflicts.degree(2), 2)
+        self.assertEqual(self.conflicts.degree(1000000007), 1)
+        self.assertEqual(self.conflicts.degree(9), 0)
+        self.assertEqual(self.conflicts.degree(-1), 0)
+
+    def test_conflicts_of(self):
+        # sorted, without duplicates
+        self.assertEqual(list(self.conflicts.conflicts_of(5)), [2, 9])
+        self.assertEqual(list(self.conflicts.conflicts_of(2)), [5, 1000000007])
+        self.assertEqual(list(self.conflicts.conflicts_of(1000000007)), [5])
+        self.assertEqual(list(self.conflicts.conflicts_of(9)), [])
+
+    def test_are_conflicting(self):
+        self.assertTrue(self.conflicts.are_conflicting(5, 9))
+        self.assertTrue(self.conflicts.are_conflicting(2, 1000000007))
+        # as the conflict file has it, which need not be symmetric
+        self.assertFalse(self.conflicts.are_conflicting(9, 5))
+        self.assertFalse(self.conflicts.are_conflicting(5, 1000000007))
+        self.assertFalse(self.conflicts.are_conflicting(5, 5))
+        self.assertFalse(self.conflicts.are_conflicting(3, 4))
+
+    def test_mapping(self):
+        conflicts = self.conflicts
+        self.assertEqual(len(conflicts), 3)
+        self.assertTrue(conflicts)
+        self.assertEqual(list(conflicts.keys()), [2, 5, 1000000007])
+        self.assertEqual({key: list(value) for key, value in conflicts.items()},
+                         {2: [5, 1000000007], 5: [2, 9], 1000000007: [5]})
+        self.assertIn(5, conflicts)
+        self.assertNotIn(9, conflicts)
+        self.assertNotIn('5', conflicts)
+        self.assertEqual(list(conflicts[2]), [5, 1000000007])
+        self.assertIsNone(conflicts.get(9))
+        with self.assertRaises(KeyError):
+            conflicts[9]
+
+    def test_empty(self):
+        conflicts = mapper.ConflictSet()
+        self.assertEqual(len(conflicts), 0)
+        self.assertFalse(conflicts)
+        self.assertEqual(list(conflicts.items()), [])
+        self.assertEqual(conflicts.degree(1), 0)
+        self.assertFalse(conflicts.are_conflicting(1, 2))
+
+    def test_size_follows_the_nodes_not_the_ids(self):
+        self.assertEqual(len(self.conflicts.offsets), 4)
+        self.assertEqual(len(self.conflicts.conflicts), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()